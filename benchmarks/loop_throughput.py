@@ -0,0 +1,79 @@
+"""
+Compare the throughput of a hello world app across the event loop policies.
+Each policy runs in its own process, with the server and the client sharing the loop.
+
+Run it with ``python benchmarks/loop_throughput.py`` from the root of the repository,
+the root is added to :data:`sys.path` so the local package is used.
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+from aiohttp import ClientSession, TCPConnector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from freesia import Freesia
+from freesia.server import install_loop_policy
+
+REQUESTS = 5000
+CONCURRENCY = 50
+POLICIES = ("asyncio", "uvloop")
+
+
+def create_app():
+    app = Freesia()
+
+    @app.route("/")
+    async def index(request):
+        return "Hello, world!"
+
+    return app
+
+
+async def bench():
+    handle = await create_app().serve("127.0.0.1", 0, banner=False)
+    url = "http://127.0.0.1:{}/".format(handle.port)
+    remaining = REQUESTS
+
+    async def client(session):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            async with session.get(url) as res:
+                await res.read()
+
+    async with ClientSession(connector=TCPConnector(limit=CONCURRENCY)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - start
+    await handle.stop()
+    return REQUESTS / elapsed
+
+
+def run(policy, queue):
+    try:
+        install_loop_policy(policy)
+    except RuntimeError as exc:
+        queue.put(str(exc))
+        return
+    loop = asyncio.new_event_loop()
+    try:
+        queue.put("{:.0f} req/s".format(loop.run_until_complete(bench())))
+    finally:
+        loop.close()
+
+
+def main():
+    for policy in POLICIES:
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=run, args=(policy, queue))
+        p.start()
+        p.join()
+        print("{:>8}: {}".format(policy, queue.get()))
+
+
+if __name__ == "__main__":
+    main()
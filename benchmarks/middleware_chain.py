@@ -0,0 +1,73 @@
+"""
+Measure the per-request overhead of the middleware against the middleware depth.
+It compares the precomposed :attr:`freesia.app.Freesia.middleware_chain` with the
+per-request nested closures, the way the middleware was traversed before the chain was precomposed.
+
+Run it with ``python benchmarks/middleware_chain.py`` from the root of the repository,
+the root is added to :data:`sys.path` so the local package is used.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp.test_utils import make_mocked_request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from freesia import Freesia
+
+ROUNDS = 20000
+DEPTHS = (0, 1, 2, 4, 8)
+
+
+async def middleware(request, handler):
+    return await handler()
+
+
+def create_app(depth):
+    app = Freesia()
+
+    @app.route("/")
+    async def index(request):
+        return "ok"
+
+    app.use([middleware] * depth)
+    return app
+
+
+async def traverse_middleware(app, request, user_handler):
+    last_handler = user_handler
+    for m in app.middleware:
+        async def h(next_handler=m, last_handler=last_handler):
+            return await next_handler(request, last_handler)
+
+        last_handler = h
+    return await last_handler()
+
+
+async def measure(func, request):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await func(request)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+async def main():
+    request = make_mocked_request("GET", "/")
+    print("{:>5} {:>14} {:>14}".format("depth", "traverse (us)", "composed (us)"))
+    for depth in DEPTHS:
+        app = create_app(depth)
+
+        async def traverse(req, app=app):
+            async def user_handler():
+                return await app.dispatch_request(req)
+
+            return await traverse_middleware(app, req, user_handler)
+
+        print("{:>5} {:>14.2f} {:>14.2f}".format(
+            depth, await measure(traverse, request), await measure(app.middleware_chain, request)))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,5 +13,5 @@ __author__ = "ArianX"
 from .app import Freesia
 from .group import Group
 from .session import get_session, set_up_session
-from .utils import jsonify, Response
+from .utils import jsonify, jsonify_stream, Response
 from .view import MethodView
@@ -0,0 +1,145 @@
+"""
+This module implements the buffered access log of the web framework.
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+from typing import Any, IO, List, Tuple
+
+from aiohttp import web
+
+from .utils import block_pool_exc
+
+logger = logging.getLogger(__name__)
+
+
+def response_size(res: web.StreamResponse) -> int:
+    """
+    Get the length of the response body known before sending it. It's 0 for the streamed responses
+    without ``Content-Length``.
+    """
+    size = res.content_length
+    if size is None:
+        size = getattr(getattr(res, "body", None), "size", None)
+    return size or 0
+
+
+class AccessLogger:
+    """
+    Access logger used by :func:`freesia.app.Freesia.enable_access_log`. The records are appended to
+    an in-memory buffer on the hot path, then a background task writes them to the stream in batches.
+    If the buffer is full, the new records are dropped instead of blocking the request.
+
+    :param stream: The stream to be written, e.g. :data:`sys.stdout`. Defaults to :data:`sys.stdout`.
+    :param path: The path of the log file. It is opened in append mode and it takes precedence over `stream`.
+    :param fmt: The format of each line. Available fields are ``time``, ``method``, ``path``, ``status``,
+                ``bytes`` and ``latency`` (in milliseconds). ``bytes`` is the length of the body known when the
+                handler returns, see :func:`response_size`, so it's 0 for the streamed responses.
+    :param sample_rate: The rate of the requests to be logged, between 0 and 1.
+    :param max_records: The max number of the buffered records.
+    :param flush_interval: The seconds between two flushes. The failed writes are logged, and their
+                           records are counted in :attr:`dropped`.
+    """
+    default_format = "{time} {method} {path} {status} {bytes} {latency:.3f}ms"
+
+    def __init__(self, stream: IO = None, path: str = None, fmt: str = None, sample_rate: float = 1.0,
+                 max_records: int = 10000, flush_interval: float = 1.0):
+        if not 0 < sample_rate <= 1:
+            raise ValueError("The param `sample_rate` should be in (0, 1].")
+        self.stream = stream
+        self.path = path
+        self.fmt = fmt or self.default_format
+        self.sample_rate = sample_rate
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        #: the number of the records dropped because the buffer is full or the write failed
+        self.dropped = 0
+        self._records = []
+        self._task = None
+
+    def record(self, method: str, path: str, status: int, size: int, latency: float) -> None:
+        """
+        Append a record to the buffer. It never blocks.
+
+        :param method: the method of the request
+        :param path: the path of the request
+        :param status: the status of the response
+        :param size: the length of the response body
+        :param latency: the seconds used to handle the request
+        :return: None
+        """
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        if len(self._records) >= self.max_records:
+            self.dropped += 1
+            return
+        self._records.append((time.time(), method, path, status, size, latency))
+
+    def format(self, records: List[Tuple]) -> str:
+        lines = []
+        for t, method, path, status, size, latency in records:
+            lines.append(self.fmt.format(
+                time=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)),
+                method=method, path=path, status=status, bytes=size, latency=latency * 1000
+            ))
+        lines.append("")
+        return "\n".join(lines)
+
+    def write_records(self, records: List[Tuple]) -> None:
+        """
+        Format the records and write them. It's run in the thread pool.
+        """
+        self.write(self.format(records))
+
+    def write(self, text: str) -> None:
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(text)
+        else:
+            stream = self.stream or sys.stdout
+            stream.write(text)
+            stream.flush()
+
+    async def flush(self) -> None:
+        """
+        Format and write all buffered records in the thread pool. The records are dropped if the write fails.
+        """
+        if not self._records:
+            return
+        records, self._records = self._records, []
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(block_pool_exc, self.write_records, records)
+        except Exception:
+            self.dropped += len(records)
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to write the access log, %d records are dropped in total.", self.dropped)
+
+    async def start(self, app: Any = None) -> None:
+        """
+        Start the background flushing task.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, app: Any = None) -> None:
+        """
+        Stop the background flushing task and write the rest records.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
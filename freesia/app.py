@@ -2,14 +2,47 @@
 This module implements the async app of the web framework.
 """
 import asyncio
+import time
+import warnings
+from collections import namedtuple
+from functools import partial
 from inspect import iscoroutinefunction
-from typing import Any, Callable, MutableMapping, Tuple, Union, Container, Sized, Iterable
-from pprint import pprint
+from typing import Any, Awaitable, Callable, MutableMapping, Mapping, Tuple, Union, Iterable
 
 from aiohttp import web
 
-from .route import Route, Router
-from .utils import Response
+from .accesslog import AccessLogger, response_size
+from .body import limit_body_size
+from .cache import ResponseCache
+from .coalesce import Coalescer
+from .monitor import LoopMonitor
+from .profiler import Profiler
+from .metrics import Metrics, METRICS_KEY, mark_series
+from .executor import ManagedExecutor, ExecutorStats, offload_handler, sync_handler, limit_concurrency
+from .route import Route, TreeRouter, DispatchCache
+from .server import ServerHandle, install_loop_policy
+from .static import StaticFiles
+from .streaming import StreamingResponse
+from .utils import Response, block_pool_exc, sync_pool_exc
+
+FreezeInfo = namedtuple("FreezeInfo", ["routes", "seconds"])
+
+
+def call_middleware(middleware: Callable, next_handler: Callable, request: web.BaseRequest) -> Awaitable:
+    """
+    Call one middleware of the composed chain. See :func:`Freesia.compose_middleware`.
+    It returns the awaitable of the middleware directly, so the hop adds no coroutine of its own.
+    """
+    return middleware(request, partial(next_handler, request))
+
+
+def call_route_middleware(middleware: Callable, next_handler: Callable, request: web.BaseRequest,
+                          *params: Any) -> Awaitable:
+    """
+    Call one middleware of the composed route chain. See :func:`Freesia.compose_route`.
+    It returns the awaitable of the middleware directly, the same as :func:`call_middleware`.
+    """
+    return middleware(request, partial(next_handler, request, *params))
 
 
 class Freesia:
@@ -20,23 +53,108 @@ class Freesia:
     #: See more information in :class:`freesia.route.Route` and :class:`freesia.route.AbstractRoute`.
     route_cls = Route
     #: Default router class.
-    #: See more information in :class:`freesia.route.Router` and :class:`freesia.route.AbstractRouter`.
-    url_map_cls = Router
+    #: See more information in :class:`freesia.route.TreeRouter` and :class:`freesia.route.AbstractRouter`.
+    url_map_cls = TreeRouter
     #: collected routes
     rules = None
     #: collected groups
     groups = None
+    #: the result of :func:`freeze`
+    freeze_info = None
+    #: the instance of :class:`freesia.accesslog.AccessLogger`, see :func:`enable_access_log`
+    access_logger = None
+    #: the instance of :class:`freesia.metrics.Metrics`, see :func:`enable_metrics`
+    metrics = None
+    #: the instance of :class:`freesia.monitor.LoopMonitor`, see :func:`enable_loop_monitor`
+    loop_monitor = None
+    #: the instance of :class:`freesia.profiler.Profiler`, see :func:`enable_profiler`
+    profiler = None
 
     def __init__(self):
         self.rules = []
         self.middleware = []
+        self.scoped_middleware = []
         self.groups = {}
+        #: the builders used by :func:`cast`, keyed by the type of the returned value.
+        self.response_casts = {
+            web.StreamResponse: lambda res: res,
+            str: lambda res: Response(text=res),
+            bytes: lambda res: Response(body=res),
+            bytearray: lambda res: Response(body=res),
+            memoryview: lambda res: Response(body=res),
+            tuple: self.cast_tuple,
+            list: self.cast_tuple,
+        }
+        self._cast_cache = {}
+        #: the cache used by the routes with the option ``cache``, see :class:`freesia.cache.ResponseCache`.
+        #: Replace it before adding the routes to use another backend.
+        self.response_cache = ResponseCache()
+        #: the coalescer used by the routes with the option ``coalesce``, see :class:`freesia.coalesce.Coalescer`.
+        self.coalescer = Coalescer()
+        #: the executors keyed by the name, see :func:`add_executor`.
+        self.executors = {"default": block_pool_exc, "sync": sync_pool_exc}
         self.url_map = self.url_map_cls()
+        #: all registered middleware composed into one callable, rebuilt by :func:`use`.
+        self.middleware_chain = self.dispatch_request
+        self.frozen = False
+        #: async callables accepting the app, called before serving
+        self.on_startup = []
+        #: async callables accepting the app, called after serving
+        self.on_shutdown = []
+
+    def check_frozen(self) -> None:
+        if self.frozen:
+            raise RuntimeError("The app has been frozen. The route table and the middleware can't be changed.")
+
+    def freeze(self) -> FreezeInfo:
+        """
+        Compile the app before serving. It compiles the routes, builds the final router structures,
+        composes the middleware chain and checks the conflicts. The route table and the middleware
+        can't be changed afterwards. It will be called by :func:`serve` automatically.
+
+        :return: A named tuple include the number of the compiled routes and the seconds it took.
+        """
+        if self.frozen:
+            return self.freeze_info
+        start = time.perf_counter()
+        self.url_map.freeze()
+        self.rules = tuple(self.rules)
+        self.middleware = tuple(self.middleware)
+        self.middleware_chain = self.compose_middleware()
+        self.frozen = True
+        self.freeze_info = FreezeInfo(len(self.rules), time.perf_counter() - start)
+        return self.freeze_info
 
     def route(self, rule: str, **options: Any) -> Callable:
         """
         Register the new route to the framework.
 
+        The middleware only used by this route can be passed by the option ``middleware``::
+
+            @app.route("/user", middleware=[auth_middleware])
+            async def user(request):
+                pass
+
+        The response can be cached for seconds by the option ``cache``. See :class:`freesia.cache.ResponseCache`.
+        The identical concurrent requests can share one call of the handler by the option ``coalesce``.
+        See :class:`freesia.coalesce.Coalescer`. The requests whose ``Content-Length`` is larger than the option
+        ``max_body_size`` are rejected before calling any scoped middleware. See :mod:`freesia.body`.
+        A sync CPU-bound handler can run in the executor named by the option ``offload``::
+
+            app.add_executor("cpu", kind="process")
+
+            @app.route("/resize", method=["POST"], offload="cpu")
+            def resize(snapshot):
+                pass
+
+        See :func:`freesia.executor.offload_handler`. The other sync handlers run in the thread pool named
+        by the option ``executor``, defaults to ``"sync"``. The option ``concurrency`` limits the number of the
+        concurrent calls of the handler::
+
+            @app.route("/report", executor="io", concurrency=4)
+            def report(request):
+                pass
+
         :param rule: url rule
         :param options: optional params
         :return: a decorator to collect the target function
@@ -59,7 +177,9 @@ class Freesia:
         :param url_filter: A tuple that includ regex, in_filter and out_filter
         :return: None
         """
+        self.check_frozen()
         self.route_cls.set_filter(name, url_filter)
+        self.url_map.invalidate()
 
     def add_route(self, rule: str, methods: Iterable[str] = None,
                   target: Callable = None,
@@ -75,6 +195,7 @@ class Freesia:
         :param view_func: the class based view. See :class:`freesia.view.View`.
         :return: None
         """
+        self.check_frozen()
         if view_func:
             if hasattr(view_func, "methods"):
                 methods = getattr(view_func, "methods")
@@ -84,43 +205,208 @@ class Freesia:
             raise ValueError("Invalid target function {}.".format(target.__name__))
 
         r = self.route_cls(rule, methods or ["GET"], target, options or {})
+        self.compose_route(r)
         self.rules.append(r)
         self.url_map.add_route(r)
 
-    async def cast(self, res: Any) -> Response:
+    def static(self, prefix: str, directory: str, endpoint: str = "static", **options: Any) -> StaticFiles:
+        """
+        Serve the files under the directory with the url prefix. See example::
+
+            app.static("/static", "./static")
+
+        The files are sent by the ``sendfile`` syscall, the small ones are cached in memory.
+        See :class:`freesia.static.StaticFiles` for the options.
+
+        :param prefix: url prefix
+        :param directory: the directory of the files
+        :param endpoint: the endpoint of the route
+        :param options: the params of :class:`freesia.static.StaticFiles`
+        :return: the instance of :class:`freesia.static.StaticFiles`
+        """
+        files = StaticFiles(directory, **options)
+        self.add_route(prefix.rstrip("/") + "/<path:filename>", ["GET"], files.handle, {"endpoint": endpoint})
+        return files
+
+    def compose_route(self, route: Route) -> None:
         """
-        Cast the res made by the user's handler to the normal response.
+        Compose the middleware scoped to the route into :attr:`freesia.route.Route.handler`.
+        The thread pool or the process pool running the sync target is the innermost, then the concurrency limit,
+        then the response cache of the route, then the coalescing, then the middleware of the route, then the ones
+        of its group, then the ones registered by :func:`use` with the ``prefix`` or the ``predicate``. The later
+        is the outer. The coroutine target without any of them is called directly.
+
+        :param route: the instance of the :class:`freesia.route.Route`
+        :return: None
+        """
+        middleware = list(route.middleware)
+        for predicate, scoped in self.scoped_middleware:
+            if predicate(route):
+                middleware.extend(scoped)
+        handler = route.target
+        if route.options.get("offload"):
+            handler = offload_handler(self.executors, route.options["offload"], handler)
+        elif not iscoroutinefunction(handler) and not iscoroutinefunction(getattr(handler, "__call__", None)):
+            handler = sync_handler(self.executors, route.options.get("executor", "sync"), handler)
+        if route.options.get("concurrency"):
+            handler = limit_concurrency(handler, route.options["concurrency"])
+        if route.options.get("cache"):
+            handler = self.response_cache.wrap(route.endpoint, handler, self.cast, route.options["cache"],
+                                               route.options.get("cache_headers", ()))
+        coalesce = route.options.get("coalesce")
+        if coalesce:
+            handler = self.coalescer.wrap(handler, self.cast, coalesce if callable(coalesce) else None)
+        for m in middleware:
+            handler = partial(call_route_middleware, m, handler)
+        if route.options.get("max_body_size") is not None:
+            handler = limit_body_size(handler, route.options["max_body_size"])
+        if self.metrics is not None:
+            handler = partial(mark_series, self.metrics.endpoint_series(route.endpoint), handler)
+        route.handler = handler
+
+    def add_executor(self, name: str, kind: str = "thread", max_workers: int = None, max_queue: int = None,
+                     **options: Any) -> ManagedExecutor:
+        """
+        Add a named executor used by the routes with the option ``offload``. See example::
+
+            app.add_executor("cpu", kind="process", max_workers=4, max_queue=64)
+
+        :param name: the name of the executor
+        :param kind: ``"thread"`` or ``"process"``
+        :param max_workers: the max number of the workers
+        :param max_queue: the max number of the queued tasks, the requests exceeding it get 503
+        :param options: other params of :class:`freesia.executor.ManagedExecutor`
+        :return: the executor
+        """
+        if name in self.executors:
+            raise ValueError("The executor `{}` has been added.".format(name))
+        executor = ManagedExecutor(name, kind, max_workers, max_queue, **options)
+        self.executors[name] = executor
+        return executor
+
+    def executor_stats(self) -> Mapping[str, ExecutorStats]:
+        """
+        Get the queue depth and the utilisation of all executors.
+
+        :return: the stats keyed by the name of the executor
+        """
+        return {name: executor.stats() for name, executor in self.executors.items()}
+
+    def enable_dispatch_cache(self, maxsize: int = 1024, cache_negative: bool = True) -> None:
+        """
+        Put a LRU cache in front of the :attr:`url_map`. The matching results are cached by the
+        method and the path, and the cache is dropped whenever the route table changes.
+        See :class:`freesia.route.DispatchCache`.
+
+        :param maxsize: the max number of the cached results
+        :param cache_negative: whether the 404 and 405 results should be cached too
+        :return: None
+        """
+        if isinstance(self.url_map, DispatchCache):
+            raise ValueError("The dispatch cache has been enabled.")
+        self.url_map = DispatchCache(self.url_map, maxsize, cache_negative)
+
+    def add_response_cast(self, tp: type, builder: Callable[[Any], web.StreamResponse]) -> None:
+        """
+        Register a builder that casts the values of the giving type, including its subclasses,
+        returned by the handlers to the response. See example::
+
+            app.add_response_cast(dict, lambda res: Response(text=json.dumps(res), content_type="application/json"))
+
+        :param tp: the type of the returned value
+        :param builder: a callable accepting the returned value and returning the response
+        :return: None
+        """
+        self.response_casts[tp] = builder
+        self._cast_cache.clear()
+
+    def resolve_cast(self, tp: type) -> Union[None, Callable]:
+        """
+        Find the builder of the type from :attr:`response_casts` by its mro, then cache the result.
+        The async iterables are streamed by :class:`freesia.streaming.StreamingResponse`.
+
+        :param tp: the type of the returned value
+        :return: the builder or None.
+        """
+        builder = None
+        for base in tp.__mro__:
+            if base in self.response_casts:
+                builder = self.response_casts[base]
+                break
+        else:
+            if hasattr(tp, "__aiter__"):
+                builder = StreamingResponse
+        self._cast_cache[tp] = builder
+        return builder
+
+    def cast_tuple(self, res: Union[tuple, list]) -> web.StreamResponse:
+        """
+        Cast the tuple like ``(body, status)`` or ``(body, status, reason)`` to the response.
+        The third item can also be a mapping of the headers. The lists are cast the same way.
+        """
+        if not 1 <= len(res) <= 3:
+            raise ValueError("Invalid response.")
+        body = res[0]
+        builder = self._cast_cache.get(body.__class__) or self.resolve_cast(body.__class__)
+        response = builder(body) if builder is not None else Response(text=str(body))
+        if len(res) == 1:
+            return response
+        if len(res) == 3 and isinstance(res[2], Mapping):
+            response.set_status(res[1])
+            response.headers.update(res[2])
+        else:
+            response.set_status(res[1], res[2] if len(res) == 3 else None)
+        return response
+
+    async def cast(self, res: Any) -> web.StreamResponse:
+        """
+        Cast the res made by the user's handler to the normal response. The builder is looked up
+        from :attr:`response_casts` by the type of the res. See :func:`add_response_cast`.
 
         :param res: route returned value
         :return: the instance of :class:`freesia.response.Response`
         """
+        if res.__class__ is Response:
+            return res
+        try:
+            builder = self._cast_cache[res.__class__]
+        except KeyError:
+            builder = self.resolve_cast(res.__class__)
+        if builder is not None:
+            return builder(res)
+
         if iscoroutinefunction(res):
             return await self.cast(await res())
-
-        if isinstance(res, Response): return res
-        if isinstance(res, str) or isinstance(res, bytes):
-            return Response(text=str(res))
-        if isinstance(res, Container) and isinstance(res, Sized):
-            if len(res) > 3:
-                raise ValueError("Invalid response.")
-
-            return Response(text=res[0],
-                            status=res[1] if len(res) >= 1 else 200,
-                            reason=res[2] if len(res) >= 2 else "ok",
-                            )
         return Response(text=str(res))
 
-    async def traverse_middleware(self, request: web.BaseRequest, user_handler: Callable) -> Any:
+    def compose_middleware(self, inner: Callable = None,
+                           hop: Callable[[Callable, Callable], Callable] = None) -> Callable:
         """
-        Call all registered middleware.
+        Compose all registered middleware into one callable which accepts the request.
+        The last registered middleware is the outermost one.
+        If there is no middleware, the `inner` handler is returned directly.
+
+        :param inner: the innermost handler accepting the request, defaults to :func:`dispatch_request`
+        :param hop: a callable accepting the middleware and the next handler and returning the handler
+                    calling the middleware, defaults to binding :func:`call_middleware`. The profiler
+                    passes its own one to time each middleware, see :class:`freesia.profiler.Profiler`.
+        :return: the composed handler
         """
-        last_handler = user_handler
+        chain = self.dispatch_request if inner is None else inner
         for m in self.middleware:
-            async def h(next_handler=m, last_handler=last_handler):
-                return await next_handler(request, last_handler)
+            chain = partial(call_middleware, m, chain) if hop is None else hop(m, chain)
+        return chain
 
-            last_handler = h
-        return await last_handler()
+    async def traverse_middleware(self, request: web.BaseRequest, user_handler: Callable) -> Any:
+        """
+        Call all registered middleware around the giving handler.
+
+        .. deprecated::
+            Use :func:`compose_middleware` instead, :func:`handler` uses the precomposed :attr:`middleware_chain`.
+        """
+        warnings.warn("`traverse_middleware` is deprecated, use `compose_middleware` instead.",
+                      DeprecationWarning, stacklevel=2)
+        return await self.compose_middleware(lambda req: user_handler())(request)
 
     async def dispatch_request(self, request: web.BaseRequest) -> Response:
         """
@@ -141,30 +427,165 @@ class Freesia:
         :param request: the instance of :class:`aiohttp.web.BaseRequest`
         :return: result
         """
-        pprint(request.path)
+        return await self.cast(await self.middleware_chain(request))
 
-        async def user_handler():
-            return await self.dispatch_request(request)
+    def enable_access_log(self, **options: Any) -> AccessLogger:
+        """
+        Log the requests with :class:`freesia.accesslog.AccessLogger`. The records are buffered
+        and written by a background task. The requests are not logged unless it's called.
 
-        res = await self.cast(
-            await self.traverse_middleware(request, user_handler)
-        )
+        :param options: the params of :class:`freesia.accesslog.AccessLogger`
+        :return: the access logger
+        """
+        self.check_frozen()
+        if self.access_logger is not None:
+            raise ValueError("The access log has been enabled.")
+        self.access_logger = AccessLogger(**options)
+        self.on_startup.append(self.access_logger.start)
+        self.on_shutdown.append(self.access_logger.stop)
+        return self.access_logger
+
+    async def logged_handler(self, next_handler: Callable, request: web.BaseRequest) -> Response:
+        """
+        Call the next handler and record the request to the :attr:`access_logger`.
+        """
+        start = time.perf_counter()
+        try:
+            res = await next_handler(request)
+        except web.HTTPException as exc:
+            self.access_logger.record(request.method, request.path, exc.status, 0, time.perf_counter() - start)
+            raise
+        except Exception:
+            self.access_logger.record(request.method, request.path, 500, 0, time.perf_counter() - start)
+            raise
+        self.access_logger.record(request.method, request.path, res.status, response_size(res),
+                                  time.perf_counter() - start)
         return res
 
-    async def serve(self, host: str, port: int):
+    def enable_metrics(self, path: str = "/metrics", **options: Any) -> Metrics:
         """
-        Start to serve. Should be placed in a event loop.
+        Count the requests and record their latency by the endpoint, the method and the status.
+        The metrics of the executors and the loop monitor are included too. See :class:`freesia.metrics.Metrics`.
 
-        :param host: host
-        :param port: port
-        :return: None
+        :param path: the url of the route rendering the metrics in the Prometheus text format, None to not add it
+        :param options: the params of :class:`freesia.metrics.Metrics`
+        :return: the metrics
         """
-        server = web.Server(self.handler)
-        runner = web.ServerRunner(server)
-        await runner.setup()
-        site = web.TCPSite(runner, host, port)
-        await site.start()
+        self.check_frozen()
+        if self.metrics is not None:
+            raise ValueError("The metrics have been enabled.")
+        self.metrics = Metrics(**options)
+        self.metrics.add_gauge("freesia_executor_queued", "Number of the tasks waiting in the executor.", lambda: {
+            (("executor", name),): executor.stats().queued for name, executor in self.executors.items()
+        })
+        self.metrics.add_gauge("freesia_executor_utilisation", "Busy workers / max workers of the executor.",
+                               lambda: {(("executor", name),): executor.stats().utilisation
+                                        for name, executor in self.executors.items()})
+        self.metrics.add_gauge("freesia_loop_lag_seconds", "Scheduling lag of the event loop.",
+                               lambda: {(): self.loop_monitor.lag} if self.loop_monitor else {})
+        self.metrics.add_gauge("freesia_loop_stalls", "Number of the times the event loop was blocked.",
+                               lambda: {(): self.loop_monitor.stalls} if self.loop_monitor else {})
+        self.on_startup.append(self.metrics.start)
+        self.on_shutdown.append(self.metrics.stop)
+        for r in self.rules:
+            self.compose_route(r)
+        self.url_map.invalidate()
+        if path is not None:
+            self.add_route(path, ["GET"], self.metrics.handle, {"endpoint": "metrics"})
+        return self.metrics
+
+    def enable_loop_monitor(self, **options: Any) -> LoopMonitor:
+        """
+        Monitor the lag of the event loop and record the stack when it's blocked, with the endpoint
+        of the route blocking it. See :class:`freesia.monitor.LoopMonitor`.
+
+        :param options: the params of :class:`freesia.monitor.LoopMonitor`
+        :return: the loop monitor
+        """
+        self.check_frozen()
+        if self.loop_monitor is not None:
+            raise ValueError("The loop monitor has been enabled.")
+        self.loop_monitor = LoopMonitor(**options)
+        self.on_startup.append(self.loop_monitor.start)
+        self.on_shutdown.append(self.loop_monitor.stop)
+        return self.loop_monitor
+
+    def enable_profiler(self, path: str = None, **options: Any) -> Profiler:
+        """
+        Profile a sample of the requests, and the requests with the trigger header. The time of each middleware,
+        the handler and the cast is aggregated by the endpoint. See :class:`freesia.profiler.Profiler`.
+
+        :param path: the url of the route dumping the timings as JSON to the local host, None to not add it
+        :param options: the params of :class:`freesia.profiler.Profiler`
+        :return: the profiler, read the timings by :func:`freesia.profiler.Profiler.dump`
+        """
+        self.check_frozen()
+        if self.profiler is not None:
+            raise ValueError("The profiler has been enabled.")
+        self.profiler = Profiler(**options)
+        if path is not None:
+            self.add_route(path, ["GET"], self.profiler.handle, {"endpoint": "profiler"})
+        return self.profiler
+
+    async def profiled_handler(self, request: web.BaseRequest) -> Response:
+        """
+        The same as :func:`handler`, and profiles the request if it's sampled by the :attr:`profiler`.
+        """
+        if self.profiler.sampled(request):
+            return await self.profiler.profile(self, request)
+        return await self.cast(await self.middleware_chain(request))
+
+    async def metered_handler(self, next_handler: Callable, request: web.BaseRequest) -> Response:
+        """
+        Call the next handler and record the request to the :attr:`metrics`.
+        """
+        start = time.perf_counter()
+        status = 500
+        try:
+            res = await next_handler(request)
+            status = res.status
+            return res
+        except web.HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            self.metrics.observe(request.get(METRICS_KEY), request.method, status, time.perf_counter() - start)
+
+    def make_handler(self) -> Callable:
+        """
+        Get the request handler used by the server. The features which are not enabled
+        are not included, so they cost nothing.
+
+        :return: the request handler
+        """
+        handler = self.handler if self.profiler is None else self.profiled_handler
+        if self.access_logger is not None:
+            handler = partial(self.logged_handler, handler)
+        if self.metrics is not None:
+            handler = partial(self.metered_handler, handler)
+        return handler
+
+    async def startup(self) -> None:
+        """
+        Call the callables in :attr:`on_startup`.
+        """
+        for h in self.on_startup:
+            await h(self)
 
+    async def shutdown(self) -> None:
+        """
+        Call the callables in :attr:`on_shutdown`, then shut down the :attr:`executors`.
+        """
+        for h in self.on_shutdown:
+            await h(self)
+        loop = asyncio.get_event_loop()
+        for executor in self.executors.values():
+            await loop.run_in_executor(None, executor.shutdown)
+
+    def print_banner(self, host: str, port: int, workers: int = 1) -> None:
+        """
+        Print the banner and the serving information.
+        """
         print("""
  _______ .______       _______     _______.     _______. __       ___       __  
 |   ____||   _  \     |   ____|   /       |    /       ||  |     /   \     |  | 
@@ -173,21 +594,84 @@ class Freesia:
 |  |     |  |\  \----.|  |____.----)   |   .----)   |   |  |  /  _____  \  |__| 
 |__|     | _| `._____||_______|_______/    |_______/    |__| /__/     \__\ (__) 
             """)
+        print("============ Compiled {} routes in {:.2f} ms ============".format(
+            self.freeze_info.routes, self.freeze_info.seconds * 1000))
         print("============ Servint on http://{}:{}/ ============".format(host, port))
+        if workers > 1:
+            print("============ Running {} workers ============".format(workers))
+
+    async def serve(self, host: str, port: int, *, reuse_port: bool = False, banner: bool = True,
+                    backlog: int = 128, keepalive_timeout: float = 75.0, max_line_size: int = 8190,
+                    max_field_size: int = 8190, access_log: bool = False) -> ServerHandle:
+        """
+        Start to serve. Should be placed in a event loop. See example::
 
-        while True:
-            await asyncio.sleep(1000 * 3600)
+            handle = await app.serve("localhost", 8080)
+            ...
+            await handle.stop()
 
-    def run(self, host="localhost", port=8080):
+        :param host: host
+        :param port: port
+        :param reuse_port: bind the port with ``SO_REUSEPORT``, so that several processes can share it
+        :param banner: whether the banner should be printed
+        :param backlog: the listen backlog
+        :param keepalive_timeout: the seconds to keep the idle connection alive
+        :param max_line_size: the max size of the request line
+        :param max_field_size: the max size of each request header
+        :param access_log: whether the aiohttp access logger is used. See :func:`enable_access_log` for
+                           the buffered one.
+        :return: the instance of :class:`freesia.server.ServerHandle`
+        """
+        self.freeze()
+        await self.startup()
+        options = dict(keepalive_timeout=keepalive_timeout, max_line_size=max_line_size,
+                       max_field_size=max_field_size)
+        if not access_log:
+            options["access_log"] = None
+        server = web.Server(self.make_handler(), **options)
+        runner = web.ServerRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port, backlog=backlog, reuse_port=reuse_port or None)
+        handle = ServerHandle(self, runner, site)
+        try:
+            await site.start()
+        except BaseException:
+            await handle.stop()
+            raise
+        if banner:
+            self.print_banner(host, port)
+        return handle
+
+    def run(self, host="localhost", port=8080, workers: int = 1,
+            loop_policy: Union[None, str, asyncio.AbstractEventLoopPolicy] = None, **options: Any):
         """
         start a async serve
+
+        :param host: host
+        :param port: port
+        :param workers: the number of the worker processes. If it's more than one, the app is frozen
+                        in the current process, then the workers are forked and supervised by
+                        :class:`freesia.worker.Supervisor`.
+        :param loop_policy: the event loop policy, see :func:`freesia.server.install_loop_policy`
+        :param options: the server options passed to :func:`serve`
         """
-        loop = asyncio.get_event_loop()
+        install_loop_policy(loop_policy)
+        if workers > 1:
+            from .worker import Supervisor
+            Supervisor(self, host, port, workers, **options).run()
+            return
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        handle = None
         try:
-            loop.run_until_complete(self.serve(host, port))
+            handle = loop.run_until_complete(self.serve(host, port, **options))
+            loop.run_until_complete(handle.wait())
         except KeyboardInterrupt:
             pass
         finally:
+            if handle is not None:
+                loop.run_until_complete(handle.stop())
             loop.close()
 
     def register_group(self, group: Any) -> None:
@@ -202,7 +686,7 @@ class Freesia:
         self.groups[group.name] = group
         group.register(self)
 
-    def use(self, middleware: Iterable) -> None:
+    def use(self, middleware: Iterable, prefix: str = None, predicate: Callable[[Route], bool] = None) -> None:
         """
         Register the middleware for this framework. See example::
 
@@ -213,10 +697,34 @@ class Freesia:
             app = Freesia()
             app.use([middleware])
 
+        The middleware registered without the ``prefix`` or the ``predicate`` runs for every request.
+        Otherwise it only runs for the matching routes, after the route has been matched::
+
+            app.use([session_middleware], prefix="/user")
+            app.use([auth_middleware], predicate=lambda route: "POST" in route.methods)
+
         :param middleware: A tuple of the middleware.
+        :param prefix: Only the routes whose rule is the prefix or under it use the middleware.
+        :param predicate: Only the routes make the predicate return true use the middleware.
         :return: None
         """
+        self.check_frozen()
+        middleware = tuple(middleware)
         for m in middleware:
             if not iscoroutinefunction(m):
                 raise ValueError("Middleware {} should be awaitable.".format(m.__name__))
-            self.middleware.append(m)
+
+        if prefix is None and predicate is None:
+            self.middleware.extend(middleware)
+            self.middleware_chain = self.compose_middleware()
+            return
+
+        if prefix is not None:
+            # match on the segment boundary, so ``/user`` doesn't match ``/users``
+            boundary = prefix.rstrip("/") + "/"
+            predicate = (lambda route, p=predicate: (route.rule == prefix or route.rule.startswith(boundary))
+                         and (p is None or p(route)))
+        self.scoped_middleware.append((predicate, middleware))
+        for r in self.rules:
+            self.compose_route(r)
+        self.url_map.invalidate()
@@ -0,0 +1,185 @@
+"""
+This module implements the request body helpers of the web framework.
+"""
+import asyncio
+import tempfile
+from typing import Any, Callable, Union
+
+from aiohttp import web
+from multidict import MultiDict
+
+from .utils import asy_json_load, block_pool_exc
+
+#: the key of the body size limit of the route in the request, see :func:`limit_body_size`
+MAX_BODY_SIZE_KEY = "freesia_max_body_size"
+#: the body size limit used when neither the route nor the helper gives one
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+
+
+def get_max_size(request: web.BaseRequest, max_size: Union[None, int]) -> int:
+    if max_size is not None:
+        return max_size
+    return request.get(MAX_BODY_SIZE_KEY, DEFAULT_MAX_BODY_SIZE)
+
+
+def check_content_length(request: web.BaseRequest, max_size: int) -> None:
+    """
+    Reject the request early if its ``Content-Length`` is larger than the limit.
+    """
+    length = request.content_length
+    if length is not None and length > max_size:
+        raise web.HTTPRequestEntityTooLarge(max_size, length)
+
+
+def limit_body_size(handler: Callable, max_size: int) -> Callable:
+    """
+    Wrap the route handler to reject the too large requests before calling it. It's used for the routes
+    registered with the option ``max_body_size``. The limit is also used by the helpers of this module.
+    """
+
+    async def limited(request: web.BaseRequest, *params: Any) -> Any:
+        check_content_length(request, max_size)
+        request[MAX_BODY_SIZE_KEY] = max_size
+        return await handler(request, *params)
+
+    return limited
+
+
+async def read_body(request: web.BaseRequest, max_size: int = None) -> bytes:
+    """
+    Read the whole body with the size limit. Throw :class:`aiohttp.web.HTTPRequestEntityTooLarge`
+    if the body is too large, even if the request has no ``Content-Length``.
+
+    :param request: the instance of :class:`aiohttp.web.BaseRequest`
+    :param max_size: the size limit. Defaults to the one of the route, or :data:`DEFAULT_MAX_BODY_SIZE`.
+    :return: the body
+    """
+    max_size = get_max_size(request, max_size)
+    check_content_length(request, max_size)
+    body = bytearray()
+    while True:
+        chunk = await request.content.readany()
+        if not chunk:
+            break
+        body.extend(chunk)
+        if len(body) > max_size:
+            raise web.HTTPRequestEntityTooLarge(max_size, len(body))
+    return bytes(body)
+
+
+async def read_json(request: web.BaseRequest, max_size: int = None) -> Any:
+    """
+    Read and decode the JSON body with the size limit. The large body is decoded in the thread pool,
+    see :func:`freesia.utils.asy_json_load`.
+
+    :param request: the instance of :class:`aiohttp.web.BaseRequest`
+    :param max_size: the size limit, see :func:`read_body`
+    :return: the decoded data
+    """
+    body = await read_body(request, max_size)
+    try:
+        return await asy_json_load(body)
+    except ValueError:
+        raise web.HTTPBadRequest(text="Invalid JSON body.")
+
+
+class UploadFile:
+    """
+    A file part of the multipart body. It's kept in memory until its size exceeds the threshold,
+    then it's spooled to a temporary file.
+
+    :param name: The name of the field.
+    :param filename: The filename given by the client.
+    :param content_type: The content type of the part.
+    :param memory_threshold: The max size kept in memory.
+    """
+
+    def __init__(self, name: str, filename: str, content_type: str, memory_threshold: int):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.memory_threshold = memory_threshold
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=memory_threshold)
+
+    @property
+    def in_memory(self) -> bool:
+        return self.size <= self.memory_threshold
+
+    async def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.in_memory:
+            self.file.write(chunk)
+        else:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(block_pool_exc, self.file.write, chunk)
+
+    async def read(self) -> bytes:
+        """
+        Read the whole content.
+        """
+        self.file.seek(0)
+        if self.in_memory:
+            return self.file.read()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(block_pool_exc, self.file.read)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __repr__(self):
+        return "<UploadFile {} {!r} {} bytes>".format(self.name, self.filename, self.size)
+
+
+async def read_multipart(request: web.BaseRequest, max_size: int = None, memory_threshold: int = 1024 * 1024,
+                         max_field_size: int = 64 * 1024) -> MultiDict:
+    """
+    Parse the multipart body as a stream. The file parts become :class:`UploadFile`, the others become str.
+
+    :param request: the instance of :class:`aiohttp.web.BaseRequest`
+    :param max_size: the limit of the whole body, see :func:`read_body`
+    :param memory_threshold: the max size of a file kept in memory
+    :param max_field_size: the max size of a part which is not a file
+    :return: A :class:`multidict.MultiDict` of the fields.
+    """
+    max_size = get_max_size(request, max_size)
+    check_content_length(request, max_size)
+    form = MultiDict()
+    total = 0
+    reader = await request.multipart()
+    try:
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.filename is None:
+                value = bytearray()
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    value.extend(chunk)
+                    total += len(chunk)
+                    if len(value) > max_field_size:
+                        raise web.HTTPRequestEntityTooLarge(max_field_size, len(value))
+                    if total > max_size:
+                        raise web.HTTPRequestEntityTooLarge(max_size, total)
+                form.add(part.name, bytes(value).decode(part.get_charset("utf-8")))
+                continue
+
+            upload = UploadFile(part.name, part.filename, part.headers.get("Content-Type"), memory_threshold)
+            form.add(part.name, upload)
+            while True:
+                chunk = await part.read_chunk()
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_size:
+                    raise web.HTTPRequestEntityTooLarge(max_size, total)
+                await upload.write(part.decode(chunk))
+    except BaseException:
+        for value in form.values():
+            if isinstance(value, UploadFile):
+                value.close()
+        raise
+    return form
@@ -0,0 +1,184 @@
+"""
+This module implements the per-route response cache of the web framework.
+"""
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Iterable, Union
+
+from aiohttp import web
+
+from .utils import Response
+
+
+class CachedResponse(namedtuple("CachedResponse", ["status", "reason", "headers", "body"])):
+    """
+    A fully built response that can be stored and rebuilt many times.
+    """
+
+    @classmethod
+    def from_response(cls, res: web.StreamResponse) -> Union[None, "CachedResponse"]:
+        """
+        Snapshot the response. None if it can't be cached, e.g. a stream response.
+        """
+        if not isinstance(res, web.Response) or not isinstance(res.body, (bytes, bytearray)):
+            return None
+        headers = tuple((k, v) for k, v in res.headers.items() if k.lower() != "content-length")
+        return cls(res.status, res.reason, headers, bytes(res.body))
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def build(self) -> Response:
+        res = Response(status=self.status, reason=self.reason, body=self.body)
+        res.headers.clear()
+        res.headers.extend(self.headers)
+        return res
+
+
+class CacheBackend(ABC):
+    """
+    The storage of :class:`ResponseCache`. Inherit it to share the cache between the workers.
+    The keys are strings and the values are :class:`CachedResponse`.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Union[None, CachedResponse]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> None:
+        pass
+
+    @abstractmethod
+    async def clear(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-memory LRU backend limited by the total bytes of the bodies.
+
+    :param max_bytes: The max total bytes of the cached bodies.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def _pop(self, key: str) -> None:
+        _, value = self._data.pop(key)
+        self.size -= value.size
+
+    async def get(self, key: str) -> Union[None, CachedResponse]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            self._pop(key)
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, value: CachedResponse, ttl: float) -> None:
+        if value.size > self.max_bytes:
+            return
+        if key in self._data:
+            self._pop(key)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self.size += value.size
+        while self.size > self.max_bytes:
+            self._pop(next(iter(self._data)))
+            self.evictions += 1
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            self._pop(key)
+
+    async def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+
+
+class ResponseCache:
+    """
+    Cache the responses of the routes registered with the option ``cache``. See example::
+
+        @app.route("/users/<int:id>", cache=5, cache_headers=("Accept-Language",))
+        async def user(request, id):
+            pass
+
+    Only the ``GET`` and ``HEAD`` requests are cached. The key is built from the endpoint, the path with
+    the query string, the converted params and the values of the ``cache_headers``.
+    The instance used by the app is :attr:`freesia.app.Freesia.response_cache`.
+
+    :param backend: The instance of :class:`CacheBackend`. Defaults to :class:`MemoryCacheBackend`.
+    """
+
+    def __init__(self, backend: CacheBackend = None):
+        self.backend = backend or MemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(endpoint: str, request: web.BaseRequest, params: tuple, headers: Iterable[str]) -> str:
+        parts = [endpoint, request.path_qs, repr(params)]
+        for h in headers:
+            parts.append(request.headers.get(h, ""))
+        return "\x00".join(parts)
+
+    def wrap(self, endpoint: str, handler: Callable, cast: Callable, ttl: float,
+             headers: Iterable[str] = ()) -> Callable:
+        """
+        Wrap the route handler with the cache.
+
+        :param endpoint: the endpoint of the route
+        :param handler: the route handler
+        :param cast: the callable used to build the response, see :func:`freesia.app.Freesia.cast`
+        :param ttl: the seconds to keep the response
+        :param headers: the names of the request headers which are part of the key
+        :return: the wrapped handler
+        """
+        headers = tuple(headers)
+
+        async def cached(request: web.BaseRequest, *params: Any) -> web.StreamResponse:
+            if request.method not in ("GET", "HEAD"):
+                return await handler(request, *params)
+            key = self.make_key(endpoint, request, params, headers)
+            value = await self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                return value.build()
+
+            self.misses += 1
+            res = await cast(await handler(request, *params))
+            if 200 <= res.status < 300:
+                value = CachedResponse.from_response(res)
+                if value is not None:
+                    await self.backend.set(key, value, ttl)
+            return res
+
+        return cached
+
+    async def invalidate(self, endpoint: str = None, path: str = None) -> None:
+        """
+        Drop the cached responses. All of them are dropped if no param is given.
+
+        :param endpoint: drop the responses of the endpoint
+        :param path: drop the responses of the path of the endpoint, including the query strings
+        """
+        if endpoint is None:
+            await self.backend.clear()
+        elif path is None:
+            await self.backend.delete_prefix(endpoint + "\x00")
+        else:
+            # the exact path ends at the separator, the query variants at ``?``
+            await self.backend.delete_prefix(endpoint + "\x00" + path + "\x00")
+            await self.backend.delete_prefix(endpoint + "\x00" + path + "?")
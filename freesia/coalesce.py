@@ -0,0 +1,114 @@
+"""
+This module implements the request coalescing (single-flight) of the web framework.
+"""
+import asyncio
+from typing import Any, Callable, Hashable
+
+from aiohttp import web
+
+from .cache import CachedResponse
+
+
+class Flight:
+    """
+    A running handler shared by the identical requests.
+    """
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class Coalescer:
+    """
+    Coalesce the identical concurrent requests of the routes registered with the option ``coalesce``.
+    While a request is being handled, the identical ones wait for its response instead of calling the handler.
+    See example::
+
+        @app.route("/report/<int:id>", coalesce=True)
+        async def report(request, id):
+            pass
+
+    The key of a request is the method, the path with the query string and the converted params by default,
+    and only the ``GET`` and ``HEAD`` requests are coalesced, the others call the handler directly.
+    Pass a callable accepting the request and the params as ``coalesce`` to build the key, then the requests
+    of any method are coalesced by it.
+
+    The shared handler keeps running until all the waiting requests are cancelled, then it's dropped at once,
+    so the later requests start a new one. Its exceptions are raised
+    to every waiting request, and the HTTP errors are answered to each of them with the same response.
+    The instance used by the app is :attr:`freesia.app.Freesia.coalescer`.
+    """
+
+    #: the methods coalesced by the default key
+    safe_methods = frozenset(("GET", "HEAD"))
+
+    def __init__(self):
+        self.flights = {}
+        #: the number of the requests which didn't call the handler
+        self.coalesced = 0
+
+    @staticmethod
+    def default_key(request: web.BaseRequest, *params: Any) -> Hashable:
+        return request.method, request.path_qs, params
+
+    async def run(self, handler: Callable, cast: Callable, request: web.BaseRequest, params: tuple) -> Any:
+        try:
+            res = await cast(await handler(request, *params))
+        except web.HTTPException as exc:
+            res = exc
+        value = CachedResponse.from_response(res)
+        return res if value is None else value
+
+    def wrap(self, handler: Callable, cast: Callable, key: Callable = None) -> Callable:
+        """
+        Wrap the route handler with the coalescing.
+
+        :param handler: the route handler
+        :param cast: the callable used to build the response, see :func:`freesia.app.Freesia.cast`
+        :param key: the callable to build the key
+        :return: the wrapped handler
+        """
+        safe_only = key is None
+        key = key or self.default_key
+
+        async def coalesced(request: web.BaseRequest, *params: Any) -> web.StreamResponse:
+            if safe_only and request.method not in self.safe_methods:
+                return await handler(request, *params)
+            k = key(request, *params)
+            while True:
+                flight = self.flights.get(k)
+                leader = flight is None
+                if leader:
+                    flight = Flight(asyncio.ensure_future(self.run(handler, cast, request, params)))
+                    self.flights[k] = flight
+                    flight.task.add_done_callback(
+                        lambda _, f=flight: self.flights.pop(k) if self.flights.get(k) is f else None)
+                else:
+                    self.coalesced += 1
+
+                flight.waiters += 1
+                try:
+                    value = await asyncio.shield(flight.task)
+                    break
+                except asyncio.CancelledError:
+                    if flight.task.cancelled():
+                        # the shared handler was cancelled but this request wasn't, so start a new flight.
+                        continue
+                    if flight.waiters == 1:
+                        if self.flights.get(k) is flight:
+                            del self.flights[k]
+                        flight.task.cancel()
+                    raise
+                finally:
+                    flight.waiters -= 1
+
+            if isinstance(value, CachedResponse):
+                return value.build()
+            if leader:
+                return value
+            # the stream response can't be shared, so the others call the handler by themselves.
+            return await handler(request, *params)
+
+        return coalesced
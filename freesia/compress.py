@@ -0,0 +1,155 @@
+"""
+This module implements the response compression middleware of the web framework.
+"""
+import asyncio
+import hashlib
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Union
+
+from aiohttp import web
+
+from .app import Freesia
+from .utils import block_pool_exc
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+def gzip_compress(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def deflate_compress(data: bytes, level: int) -> bytes:
+    return zlib.compress(data, level)
+
+
+def brotli_compress(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=min(level, 11))
+
+
+class Compression:
+    """
+    Compress the response bodies by the ``Accept-Encoding`` of the request. Use :func:`set_up_compression`
+    to register it. The bodies smaller than `min_size` are sent as they are. The bodies larger than
+    `offload_size` are compressed in the executor, so the event loop is not blocked. The compressed
+    bodies are cached by the hash of the original body, so the unchanged responses are compressed once.
+
+    :param app: The instance of :class:`freesia.app.Freesia`, used to cast the returned values.
+    :param min_size: The min size of the body to be compressed.
+    :param level: The compression level, from 1 to 9.
+    :param offload_size: The min size of the body to be compressed in the executor.
+    :param executor: The executor used to compress. Defaults to :data:`freesia.utils.block_pool_exc`.
+    :param cache_bytes: The max total bytes of the cached compressed bodies. ``0`` disables the cache.
+    """
+    #: the supported encodings, in the order of preference
+    encodings = OrderedDict()
+    if brotli is not None:
+        encodings["br"] = brotli_compress
+    encodings["gzip"] = gzip_compress
+    encodings["deflate"] = deflate_compress
+
+    def __init__(self, app: Freesia, min_size: int = 1024, level: int = 6, offload_size: int = 64 * 1024,
+                 executor: Executor = None, cache_bytes: int = 8 * 1024 * 1024):
+        if not 1 <= level <= 9:
+            raise ValueError("The param `level` should be between 1 and 9.")
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.offload_size = offload_size
+        self.executor = executor or block_pool_exc
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self._cache = OrderedDict()
+
+    def negotiate(self, accept_encoding: str) -> Union[None, str]:
+        """
+        Choose the encoding from the ``Accept-Encoding`` header.
+
+        :param accept_encoding: the value of the header
+        :return: the encoding or None.
+        """
+        accepted = {}
+        for item in accept_encoding.lower().split(","):
+            coding, _, params = item.partition(";")
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[coding.strip()] = q
+        best, best_q = None, 0.0
+        for coding in self.encodings:
+            q = accepted.get(coding, accepted.get("*", 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    async def compress(self, body: bytes, encoding: str) -> bytes:
+        """
+        Compress the body, using the cache if possible.
+        """
+        key = None
+        if self.cache_bytes:
+            key = (hashlib.blake2b(body, digest_size=16).digest(), len(body), encoding)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        func = self.encodings[encoding]
+        if len(body) >= self.offload_size:
+            loop = asyncio.get_event_loop()
+            compressed = await loop.run_in_executor(self.executor, func, body, self.level)
+        else:
+            compressed = func(body, self.level)
+
+        if key is not None and len(compressed) <= self.cache_bytes:
+            self._cache[key] = compressed
+            self.cached_bytes += len(compressed)
+            while self.cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        return compressed
+
+    async def middleware(self, request: web.BaseRequest, handler: Callable) -> Any:
+        res = await handler()
+        accept_encoding = request.headers.get("Accept-Encoding")
+        if not accept_encoding:
+            return res
+        if not isinstance(res, web.StreamResponse):
+            res = await self.app.cast(res)
+        if not isinstance(res, web.Response) or res.status < 200 or res.status in (204, 304) \
+                or "Content-Encoding" in res.headers:
+            return res
+        body = res.body
+        if not isinstance(body, (bytes, bytearray)) or len(body) < self.min_size:
+            return res
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return res
+
+        res.body = await self.compress(body, encoding)
+        res.headers["Content-Encoding"] = encoding
+        vary = res.headers.get("Vary")
+        if vary is None:
+            res.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            res.headers["Vary"] = vary + ", Accept-Encoding"
+        return res
+
+
+def set_up_compression(app: Freesia, **options: Any) -> Compression:
+    """
+    Setup the compression middleware to the app. It should be the last registered middleware,
+    so that the others get the original returned values. See :class:`Compression` for the options.
+    """
+    compression = Compression(app, **options)
+    app.use([compression.middleware])
+    return compression
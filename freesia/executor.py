@@ -0,0 +1,221 @@
+"""
+This module implements the named executors of the web framework.
+"""
+import asyncio
+import inspect
+import os
+import signal
+import threading
+from collections import namedtuple
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, Future
+from typing import Any, Callable
+
+from aiohttp import web
+from aiohttp.web import BaseRequest
+from multidict import CIMultiDict, MultiDict
+
+ExecutorStats = namedtuple("ExecutorStats", ["name", "kind", "max_workers", "queued", "active", "completed",
+                                             "rejected", "utilisation"])
+
+
+class ExecutorBusy(RuntimeError):
+    """
+    Raised by :func:`ManagedExecutor.submit` when the queue of the executor is full.
+    """
+
+
+def init_process(initializer: Callable = None, initargs: tuple = ()) -> None:
+    """
+    The initializer of the process pool workers. The handlers of ``SIGTERM`` inherited from the event loop
+    of the parent are reset, so the workers can be terminated. Then the initializer of the user is called.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.set_wakeup_fd(-1)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class ManagedExecutor(Executor):
+    """
+    A thread pool or a process pool with a name, a queue limit and the metrics. It can be passed
+    to :func:`asyncio.AbstractEventLoop.run_in_executor` like any executor.
+
+    The tasks submitted but not finished are counted as active up to `max_workers`, the rest are counted
+    as queued. Only the completion callback takes a lock, since it runs in the worker threads.
+
+    The pool is created on the first submit and recreated when the process id changes, so the executors
+    added before :func:`freesia.app.Freesia.run` forks the workers are not shared by them. The pools are shut
+    down by :func:`freesia.app.Freesia.shutdown`, and created again if more tasks are submitted.
+
+    :param name: The name of the executor.
+    :param kind: ``"thread"`` or ``"process"``.
+    :param max_workers: The max number of the workers. Defaults to the default of the pool.
+    :param max_queue: The max number of the queued tasks, :class:`ExecutorBusy` is raised if it's exceeded.
+                      None means unlimited.
+    :param options: Other params passed to the pool, e.g. ``mp_context`` of the process pool.
+    """
+    kinds = {
+        "thread": ThreadPoolExecutor,
+        "process": ProcessPoolExecutor,
+    }
+
+    def __init__(self, name: str, kind: str = "thread", max_workers: int = None, max_queue: int = None,
+                 **options: Any):
+        if kind not in self.kinds:
+            raise ValueError("The param `kind` should be one of {}.".format(", ".join(self.kinds)))
+        self.name = name
+        self.kind = kind
+        self.max_queue = max_queue
+        if max_workers is None:
+            cpus = os.cpu_count() or 1
+            max_workers = min(32, cpus + 4) if kind == "thread" else cpus
+        self.max_workers = max_workers
+        if kind == "process":
+            options = dict(options, initializer=init_process,
+                           initargs=(options.get("initializer"), tuple(options.get("initargs", ()))))
+        self.options = options
+        self.submitted = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+        #: the number of the tasks rejected because the queue is full
+        self.rejected = 0
+        self._pool = None
+        self._pid = None
+
+    @property
+    def pool(self) -> Executor:
+        """
+        The pool of the current process. The counters are reset with it, since the tasks of the parent
+        process are never completed in the child.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pool = None
+            self._pid = pid
+            self._lock = threading.Lock()
+            self.submitted = self.completed = self.rejected = 0
+        if self._pool is None:
+            self._pool = self.kinds[self.kind](max_workers=self.max_workers, **self.options)
+        return self._pool
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self.completed += 1
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.completed
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        pool = self.pool
+        if self.max_queue is not None and self.pending - self.max_workers >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy("The queue of the executor `{}` is full.".format(self.name))
+        future = pool.submit(fn, *args, **kwargs)
+        self.submitted += 1
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run the function in the executor and wait for the result.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self, fn, *args)
+
+    def shutdown(self, wait: bool = True, **kwargs: Any) -> None:
+        # the pool is detached first, so the tasks submitted meanwhile go to a new one.
+        pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait, **kwargs)
+
+    def stats(self) -> ExecutorStats:
+        """
+        Get the metrics of the executor.
+        """
+        pending = self.pending
+        active = min(pending, self.max_workers)
+        return ExecutorStats(self.name, self.kind, self.max_workers, pending - active, active, self.completed,
+                             self.rejected, active / self.max_workers)
+
+
+class RequestSnapshot(namedtuple("RequestSnapshot", ["method", "path", "query", "headers", "body"])):
+    """
+    A picklable copy of the request passed to the offloaded handlers, see :func:`offload_handler`.
+    """
+    __slots__ = ()
+
+    @classmethod
+    async def from_request(cls, request: BaseRequest) -> "RequestSnapshot":
+        body = await request.read() if request.can_read_body else b""
+        return cls(request.method, request.path, MultiDict(request.query), CIMultiDict(request.headers), body)
+
+    def text(self, encoding: str = "utf-8") -> str:
+        return self.body.decode(encoding)
+
+
+def offload_handler(executors: dict, name: str, target: Callable) -> Callable:
+    """
+    Wrap the sync target to run in the named executor. The target is called with a :class:`RequestSnapshot`
+    and the url params, so it and its result should be picklable if the executor is a process pool.
+    The response is 503 if the queue of the executor is full.
+
+    :param executors: the executors keyed by the name, it's looked up when the request comes.
+    :param name: the name of the executor
+    :param target: the sync handler
+    :return: the async handler
+    """
+
+    async def handler(request: BaseRequest, *params: Any) -> Any:
+        try:
+            executor = executors[name]
+        except KeyError:
+            raise RuntimeError("The executor `{}` has not been added.".format(name)) from None
+        snapshot = await RequestSnapshot.from_request(request)
+        try:
+            return await executor.run(target, snapshot, *params)
+        except ExecutorBusy:
+            raise web.HTTPServiceUnavailable()
+
+    return handler
+
+
+def sync_handler(executors: dict, name: str, target: Callable) -> Callable:
+    """
+    Wrap the sync target to run in the named thread pool. Unlike :func:`offload_handler`, the target
+    gets the request itself, so it can't read the body, which needs awaiting. If the target returns an
+    awaitable, e.g. it's a sync wrapper of a coroutine function, the awaitable is awaited on the loop.
+
+    :param executors: the executors keyed by the name, it's looked up when the request comes.
+    :param name: the name of the executor
+    :param target: the sync handler
+    :return: the async handler
+    """
+
+    async def handler(request: BaseRequest, *params: Any) -> Any:
+        try:
+            res = await executors[name].run(target, request, *params)
+        except ExecutorBusy:
+            raise web.HTTPServiceUnavailable()
+        if inspect.isawaitable(res):
+            return await res
+        return res
+
+    return handler
+
+
+def limit_concurrency(handler: Callable, limit: int) -> Callable:
+    """
+    Limit the number of the concurrent calls of the handler. The later requests wait for the earlier ones.
+
+    :param handler: the async handler
+    :param limit: the max number of the concurrent calls
+    :return: the limited handler
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(request: BaseRequest, *params: Any) -> Any:
+        async with semaphore:
+            return await handler(request, *params)
+
+    return limited
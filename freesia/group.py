@@ -13,12 +13,16 @@ class Group:
 
     :param name: Name of this group.
     :param url_prefix: Url prefix of this group. All rules registered to this group will be prefixed to the `url_prefix`.
+    :param middleware: The middleware only used by the routes of this group.
     """
 
-    def __init__(self, name: str, url_prefix: str):
+    def __init__(self, name: str, url_prefix: str, middleware: Iterable = None):
         self.name = name
         self.url_prefix = url_prefix
+        self.middleware = list(middleware or ())
         self.deferred_function = []
+        #: whether the group has been registered to an app, see :func:`freesia.app.Freesia.register_group`
+        self.registered = False
 
     def record(self, func: Callable) -> None:
         def decorator(app):
@@ -27,6 +31,7 @@ class Group:
         self.deferred_function.append(decorator)
 
     def register(self, app):
+        self.registered = True
         proxy = self.make_proxy(app)
 
         for deferred in self.deferred_function:
@@ -50,6 +55,19 @@ class Group:
             lambda s: s.add_route(rule, methods, target, options)
         )
 
+    def use(self, middleware: Iterable) -> None:
+        """
+        Register the middleware only used by the routes of this group. It should be called before the group is
+        registered, since the middleware are composed into the routes then. See :func:`freesia.app.Freesia.use`.
+
+        :param middleware: A tuple of the middleware.
+        :return: None
+        """
+        if self.registered:
+            raise RuntimeError("The group `{}` has been registered, its middleware can't be changed.".format(
+                self.name))
+        self.middleware.extend(middleware)
+
     def set_filter(self, name: str, url_filter: Tuple[str, Union[None, Callable], Union[None, Callable]]):
         self.record(
             lambda s: s.app.set_filter(name, url_filter)
@@ -62,6 +80,7 @@ class GroupRegisterProxy:
         self.app = app
 
     def add_route(self, rule: str, methods: Iterable[str], target: Callable, options: MutableMapping) -> None:
+        options = dict(options)
         if self.group.url_prefix:
             rule = '/'.join((
                 self.group.url_prefix.rstrip('/'),
@@ -72,5 +91,7 @@ class GroupRegisterProxy:
             options["endpoint"] = "{}.{}".format(self.group.name, options["endpoint"])
         else:
             options["endpoint"] = "{}.{}".format(self.group.name, target.__name__)
+        if self.group.middleware:
+            options["middleware"] = tuple(options.get("middleware", ())) + tuple(self.group.middleware)
 
         self.app.add_route(rule, methods, target, options)
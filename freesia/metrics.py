@@ -0,0 +1,236 @@
+"""
+This module implements the request metrics of the web framework.
+"""
+import asyncio
+import json
+import os
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable, List, Mapping, MutableMapping, Tuple
+
+from aiohttp.web import BaseRequest
+
+from .utils import block_pool_exc, Response
+
+METRICS_KEY = "freesia_metrics"
+
+#: The upper bounds, in seconds, of the buckets of the latency histogram.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    return ",".join("{}=\"{}\"".format(k, escape_label(str(v))) for k, v in labels)
+
+
+class Metrics:
+    """
+    The request counters and the latency histograms labelled by the endpoint, the method and the status.
+    It's used by :func:`freesia.app.Freesia.enable_metrics`.
+
+    Each endpoint owns a series mapping ``(method, status)`` to a list of counters, which holds the count of
+    each bucket, then the count above the last bucket, then the sum of the latency. The series is bound to
+    the route when it's composed, so the recording only looks up the counters and increases them in place.
+    It runs in the event loop, so it needs no lock.
+
+    In multi-process mode, pass the same `directory` to every worker. Each worker writes its metrics to
+    the file named by its pid, and :func:`render` combines all the files. The directory should be emptied
+    before starting the server, or the counters of the last run are included.
+
+    :param buckets: The upper bounds of the buckets in seconds, in ascending order.
+    :param directory: The directory shared by the workers.
+    :param flush_interval: The seconds between two writes of the metrics file.
+    """
+    unmatched = ""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, directory: str = None,
+                 flush_interval: float = 1.0):
+        self.buckets = tuple(buckets)
+        if list(self.buckets) != sorted(self.buckets):
+            raise ValueError("The param `buckets` should be in ascending order.")
+        self.directory = directory
+        self.flush_interval = flush_interval
+        #: the series keyed by the endpoint
+        self.series = {}
+        #: the gauges keyed by the name, see :func:`add_gauge`
+        self.gauges = {}
+        self._task = None
+
+    def endpoint_series(self, endpoint: str) -> MutableMapping[Tuple[str, int], List]:
+        """
+        Get the series of the endpoint, it's created if not existing.
+        """
+        return self.series.setdefault(endpoint, {})
+
+    def observe(self, series: MutableMapping, method: str, status: int, latency: float) -> None:
+        """
+        Record a request.
+
+        :param series: the series returned by :func:`endpoint_series`, None for the unmatched requests
+        :param method: the method of the request
+        :param status: the status of the response
+        :param latency: the seconds used to handle the request
+        """
+        if series is None:
+            series = self.endpoint_series(self.unmatched)
+        counters = series.get((method, status))
+        if counters is None:
+            counters = series[(method, status)] = [0] * (len(self.buckets) + 1) + [0.0]
+        counters[bisect_left(self.buckets, latency)] += 1
+        counters[-1] += latency
+
+    def add_gauge(self, name: str, doc: str, collect: Callable[[], Mapping[Tuple, float]]) -> None:
+        """
+        Add a gauge collected when rendering. See example::
+
+            metrics.add_gauge("queue_depth", "Queued tasks.", lambda: {(("pool", "cpu"),): 3})
+
+        :param name: the name of the metric
+        :param doc: the help text
+        :param collect: a callable returning the values keyed by the labels, a tuple of the pairs of the label
+        """
+        self.gauges[name] = (doc, collect)
+
+    def snapshot(self) -> dict:
+        """
+        Get the JSON serializable copy of the metrics of this process.
+        """
+        return {
+            "series": {
+                endpoint: [[method, status, list(counters)] for (method, status), counters in series.items()]
+                for endpoint, series in self.series.items()
+            },
+            "gauges": {
+                name: [[list(map(list, labels)), value] for labels, value in collect().items()]
+                for name, (_, collect) in self.gauges.items()
+            },
+        }
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, "{}.json".format(os.getpid()))
+
+    def write(self, text: str) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+
+    def collect(self, own: dict = None) -> List[Tuple[str, dict]]:
+        """
+        Get the snapshots of all processes with their pid. Only this process is included without `directory`.
+
+        :param own: the snapshot of this process, it's taken if not given
+        """
+        pid = str(os.getpid())
+        snapshots = [(pid, own or self.snapshot())]
+        if self.directory is None:
+            return snapshots
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name[:-5] == pid:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append((name[:-5], json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, own: dict = None) -> str:
+        """
+        Render the metrics of all processes in the Prometheus text format.
+
+        :param own: the snapshot of this process, it's taken if not given
+        """
+        snapshots = self.collect(own)
+        merged = {}
+        for _, snapshot in snapshots:
+            for endpoint, items in snapshot["series"].items():
+                for method, status, counters in items:
+                    total = merged.setdefault((endpoint, method, status), [0] * len(counters))
+                    for i, c in enumerate(counters):
+                        total[i] += c
+
+        lines = [
+            "# HELP freesia_requests_total Total number of the requests.",
+            "# TYPE freesia_requests_total counter",
+        ]
+        for (endpoint, method, status), counters in sorted(merged.items()):
+            labels = format_labels((("endpoint", endpoint), ("method", method), ("status", status)))
+            lines.append("freesia_requests_total{{{}}} {}".format(labels, sum(counters[:-1])))
+        lines.append("# HELP freesia_request_duration_seconds Latency of the requests.")
+        lines.append("# TYPE freesia_request_duration_seconds histogram")
+        for (endpoint, method, status), counters in sorted(merged.items()):
+            labels = format_labels((("endpoint", endpoint), ("method", method), ("status", status)))
+            cumulative = 0
+            for bound, c in zip(self.buckets + ("+Inf",), counters):
+                cumulative += c
+                lines.append("freesia_request_duration_seconds_bucket{{{},le=\"{}\"}} {}".format(
+                    labels, bound, cumulative))
+            lines.append("freesia_request_duration_seconds_sum{{{}}} {}".format(labels, counters[-1]))
+            lines.append("freesia_request_duration_seconds_count{{{}}} {}".format(labels, cumulative))
+
+        for name, (doc, _) in sorted(self.gauges.items()):
+            lines.append("# HELP {} {}".format(name, doc))
+            lines.append("# TYPE {} gauge".format(name))
+            for pid, snapshot in snapshots:
+                for labels, value in snapshot["gauges"].get(name, ()):
+                    if self.directory is not None:
+                        labels = list(labels) + [("pid", pid)]
+                    if labels:
+                        lines.append("{}{{{}}} {}".format(name, format_labels(labels), value))
+                    else:
+                        lines.append("{} {}".format(name, value))
+        lines.append("")
+        return "\n".join(lines)
+
+    async def handle(self, request: BaseRequest) -> Response:
+        """
+        The handler of the metrics route. The snapshot is taken in the loop, then the files of the other
+        workers are read and rendered in the thread pool.
+        """
+        loop = asyncio.get_event_loop()
+        text = await loop.run_in_executor(block_pool_exc, self.render, self.snapshot())
+        return Response(text=text, content_type="text/plain", charset="utf-8")
+
+    async def flush(self) -> None:
+        """
+        Write the metrics of this process to the `directory`.
+        """
+        if self.directory is None:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(block_pool_exc, self.write, json.dumps(self.snapshot()))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self, app: Any = None) -> None:
+        """
+        Start the background task writing the metrics file, if `directory` is set.
+        """
+        if self.directory is not None and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, app: Any = None) -> None:
+        """
+        Stop the background task and write the metrics file.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+def mark_series(series: MutableMapping, handler: Callable, request: BaseRequest, *params: Any) -> Awaitable:
+    """
+    Bind the series of the route to the request. It's composed into the route by
+    :func:`freesia.app.Freesia.compose_route` when the metrics are enabled.
+    It returns the awaitable of the handler directly, the same as :func:`freesia.app.call_route_middleware`.
+    """
+    request[METRICS_KEY] = series
+    return handler(request, *params)
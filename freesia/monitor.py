@@ -0,0 +1,148 @@
+"""
+This module implements the event loop monitor of the web framework.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+from typing import Any, Callable, Iterable, Optional
+
+#: A stall of the event loop. `stack` is the formatted stack of the loop thread when the stall was detected,
+#: `endpoint` is the endpoint of the route found in the stack, or None.
+SlowCallback = namedtuple("SlowCallback", ["time", "blocked", "endpoint", "stack"])
+
+
+def endpoint_codes(routes: Iterable) -> dict:
+    """
+    Map the code objects of the route targets, and the methods of the class based views, to the endpoints.
+    The code shared by the different endpoints is not mapped.
+    """
+    codes = {}
+    for route in routes:
+        functions = [route.target]
+        view_class = getattr(route.target, "view_class", None)
+        if view_class is not None:
+            functions.append(view_class.dispatch_request)
+            functions.extend(getattr(view_class, m) for m in view_class.methods or () if hasattr(view_class, m))
+        for f in functions:
+            code = getattr(f, "__code__", None)
+            if code is None:
+                continue
+            if codes.get(code, route.endpoint) != route.endpoint:
+                codes[code] = None
+            else:
+                codes[code] = route.endpoint
+    return codes
+
+
+class LoopMonitor:
+    """
+    Measure the scheduling lag of the event loop and detect the callbacks blocking it.
+    It's used by :func:`freesia.app.Freesia.enable_loop_monitor`.
+
+    A timer in the loop wakes up every `interval` seconds. The lag is how much later it wakes up than
+    expected. A watchdog thread checks the last wake-up of the timer, if the loop hasn't woken up for
+    `threshold` seconds, it takes the stack of the loop thread and records it as a :class:`SlowCallback`,
+    with the endpoint of the route found in the stack. Only one record is taken per stall.
+
+    :param interval: The seconds between two wake-ups of the timer.
+    :param threshold: The seconds the loop is blocked to be recorded.
+    :param max_records: The max number of the kept records, the older ones are dropped.
+    :param on_slow: A callable accepting the :class:`SlowCallback`, called in the watchdog thread.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5, max_records: int = 100,
+                 on_slow: Callable[[SlowCallback], Any] = None):
+        if threshold <= interval:
+            raise ValueError("The param `threshold` should be larger than `interval`.")
+        self.interval = interval
+        self.threshold = threshold
+        self.on_slow = on_slow
+        #: the lag of the last wake-up in seconds
+        self.lag = 0.0
+        #: the max lag in seconds
+        self.max_lag = 0.0
+        #: the number of the detected stalls
+        self.stalls = 0
+        #: the recent :class:`SlowCallback`
+        self.slow_callbacks = deque(maxlen=max_records)
+        self.codes = {}
+        self._beat = time.monotonic()
+        self._thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(loop.time() - expected, 0.0)
+            if self.lag > self.max_lag:
+                self.max_lag = self.lag
+            self._beat = time.monotonic()
+
+    def find_endpoint(self, frame: Any) -> Optional[str]:
+        while frame is not None:
+            endpoint = self.codes.get(frame.f_code)
+            if endpoint is not None:
+                return endpoint
+            frame = frame.f_back
+        return None
+
+    def check(self, reported: float) -> float:
+        """
+        Check the loop once, it's called by the watchdog thread.
+
+        :param reported: the last wake-up already reported
+        :return: the last wake-up reported after checking
+        """
+        beat = self._beat
+        blocked = time.monotonic() - beat
+        if blocked < self.threshold or beat == reported:
+            return reported
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return reported
+        record = SlowCallback(time.time(), blocked, self.find_endpoint(frame),
+                              "".join(traceback.format_stack(frame)))
+        self.stalls += 1
+        self.slow_callbacks.append(record)
+        if self.on_slow is not None:
+            self.on_slow(record)
+        return beat
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            reported = self.check(reported)
+
+    async def start(self, app: Any = None) -> None:
+        """
+        Start the timer and the watchdog thread in the running loop.
+        """
+        if self._task is not None:
+            return
+        if app is not None:
+            self.codes = endpoint_codes(app.rules)
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="freesia-loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self, app: Any = None) -> None:
+        """
+        Stop the timer and the watchdog thread.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stopped.set()
+        self._watchdog.join()
+        self._watchdog = None
@@ -0,0 +1,178 @@
+"""
+This module implements the sampling request profiler of the web framework.
+"""
+import random
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Tuple
+
+from aiohttp import web
+from aiohttp.web import BaseRequest
+
+from .utils import Response, jsonify
+
+PROFILE_KEY = "freesia_profile"
+
+
+class ProfileRecord:
+    """
+    The timings of one profiled request.
+    """
+    __slots__ = ("endpoint", "hops")
+
+    def __init__(self):
+        self.endpoint = ""
+        #: the pairs of the name and the inclusive seconds, in the order of finishing, so the inner one is first
+        self.hops = []
+
+    def self_times(self) -> List[Tuple[str, float]]:
+        """
+        Get the seconds spent in each hop itself, excluding the inner ones.
+        """
+        result = []
+        inner = 0.0
+        for name, inclusive in self.hops:
+            result.append((name, inclusive - inner))
+            inner = inclusive
+        return result
+
+
+async def timed_middleware(name: str, middleware: Callable, next_handler: Callable, request: BaseRequest) -> Any:
+    """
+    Call one middleware of the profiled chain and record its time. See :func:`Profiler.build_chain`.
+    """
+    start = time.perf_counter()
+    try:
+        return await middleware(request, partial(next_handler, request))
+    finally:
+        request[PROFILE_KEY].hops.append(("middleware:" + name, time.perf_counter() - start))
+
+
+class Profiler:
+    """
+    Profile a sample of the requests, used by :func:`freesia.app.Freesia.enable_profiler`. The time of each
+    global middleware, the handler including the middleware of the route, and the cast of the result
+    are recorded separately, and aggregated by the endpoint.
+
+    The requests not sampled go through the normal :attr:`freesia.app.Freesia.middleware_chain`. The sampled
+    ones go through an instrumented copy of it, which is built on the first sampled request after the
+    middleware changes.
+
+    :param sample_rate: The rate of the requests to be profiled, between 0 and 1.
+    :param trigger_header: The requests with the header are always profiled. None to disable it.
+    :param trigger_value: The required value of the trigger header, None to accept any value.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, trigger_header: str = "X-Freesia-Profile",
+                 trigger_value: str = None):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("The param `sample_rate` should be in [0, 1].")
+        self.sample_rate = sample_rate
+        self.trigger_header = trigger_header
+        self.trigger_value = trigger_value
+        #: the aggregated timings keyed by the endpoint then the phase, each is ``[count, total, max]``
+        self.stats = {}
+        self._chain = (None, None)
+        self._endpoints = {}
+
+    def sampled(self, request: BaseRequest) -> bool:
+        """
+        Check whether the request should be profiled.
+        """
+        if self.trigger_header is not None:
+            value = request.headers.get(self.trigger_header)
+            if value is not None and (self.trigger_value is None or value == self.trigger_value):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def timed_hop(middleware: Callable, next_handler: Callable) -> Callable:
+        return partial(timed_middleware, getattr(middleware, "__qualname__", repr(middleware)), middleware,
+                       next_handler)
+
+    def build_chain(self, app: Any) -> Callable:
+        """
+        Build the instrumented middleware chain of the app by :func:`freesia.app.Freesia.compose_middleware`,
+        so it has the same order as :attr:`freesia.app.Freesia.middleware_chain`. It's rebuilt if the
+        middleware of the app changed.
+        """
+        source, chain = self._chain
+        if source is app.middleware_chain:
+            return chain
+        chain = app.compose_middleware(partial(self.timed_dispatch, app), self.timed_hop)
+        self._chain = (app.middleware_chain, chain)
+        return chain
+
+    def endpoint_of(self, app: Any, handler: Callable) -> str:
+        endpoint = self._endpoints.get(handler)
+        if endpoint is None:
+            self._endpoints = {r.handler: r.endpoint for r in app.rules}
+            endpoint = self._endpoints.get(handler, "")
+        return endpoint
+
+    async def timed_dispatch(self, app: Any, request: BaseRequest) -> Any:
+        """
+        The same as :func:`freesia.app.Freesia.dispatch_request`, and records the time of the handler.
+        """
+        record = request[PROFILE_KEY]
+        start = time.perf_counter()
+        try:
+            target, params = app.url_map.get(request.path, request.method)
+            record.endpoint = self.endpoint_of(app, target)
+            return await target(request, *params)
+        finally:
+            record.hops.append(("handler", time.perf_counter() - start))
+
+    async def profile(self, app: Any, request: BaseRequest) -> web.StreamResponse:
+        """
+        Handle the request with the instrumented chain and record the timings.
+        """
+        record = request[PROFILE_KEY] = ProfileRecord()
+        start = time.perf_counter()
+        try:
+            res = await self.build_chain(app)(request)
+            cast_start = time.perf_counter()
+            res = await app.cast(res)
+            self.add(record.endpoint, "cast", time.perf_counter() - cast_start)
+            return res
+        finally:
+            for name, seconds in record.self_times():
+                self.add(record.endpoint, name, seconds)
+            self.add(record.endpoint, "total", time.perf_counter() - start)
+
+    def add(self, endpoint: str, phase: str, seconds: float) -> None:
+        phases = self.stats.get(endpoint)
+        if phases is None:
+            phases = self.stats[endpoint] = {}
+        item = phases.get(phase)
+        if item is None:
+            phases[phase] = [1, seconds, seconds]
+            return
+        item[0] += 1
+        item[1] += seconds
+        if seconds > item[2]:
+            item[2] = seconds
+
+    def dump(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Get the aggregated timings keyed by the endpoint then the phase. The phases are ``total``,
+        ``middleware:<name>``, ``handler`` and ``cast``, the times of the middleware exclude the inner ones.
+        """
+        return {
+            endpoint: {
+                phase: {"count": count, "total": total, "mean": total / count, "max": maximum}
+                for phase, (count, total, maximum) in phases.items()
+            }
+            for endpoint, phases in self.stats.items()
+        }
+
+    def reset(self) -> None:
+        self.stats = {}
+
+    async def handle(self, request: BaseRequest) -> Response:
+        """
+        The handler of the dump route. Only the requests from the local host are accepted.
+        """
+        if request.remote not in ("127.0.0.1", "::1"):
+            raise web.HTTPForbidden()
+        return await jsonify(self.dump())
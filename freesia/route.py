@@ -2,9 +2,10 @@
 This module implements the route class of the framework.
 """
 import re
-import itertools
+from collections import OrderedDict, namedtuple
 from inspect import signature, iscoroutinefunction
 from abc import ABC, abstractmethod
+from types import MappingProxyType
 from typing import Callable, MutableMapping, Tuple, Any, Iterable, Union, List, Sized
 
 from aiohttp import web
@@ -15,11 +16,14 @@ class AbstractRoute(ABC):
     AbstractRoute can only be used if you want to replace the default :class:`Route`.
     If you really want to do, you should inherit this class and
     implement the methods :func:`__init__`, :func:`set_filter` it requires. Then replace the default :attr:`app.Freesia.route_cls`
-    with you own defined class before instantiating :class:`app.Freesia`. See example::
+    with you own defined class before instantiating :class:`app.Freesia`. The app reads the attributes
+    :attr:`rule`, :attr:`target`, :attr:`endpoint`, :attr:`options` and :attr:`middleware`, and sets :attr:`handler`,
+    so the route should set the ones it supports. See example::
 
         class CustomRoute(AbstractRoute):
             def __init__(self, rule, methods, target, options):
-                pass
+                self.rule = rule
+                self.target = target
 
             def set_filter(self, name, url_filter):
                 pass
@@ -31,11 +35,34 @@ class AbstractRoute(ABC):
     :param target: The handler function that handles the request.
     :param options: Optional control parameters.
     """
+    #: the url rule
+    rule = None
+    #: the handler function
+    target = None
+    #: the name of the route
+    endpoint = None
+    #: the optional control parameters used by the app, e.g. ``cache``
+    options = MappingProxyType({})
+    #: the middleware only used by the route
+    middleware = ()
+    _handler = None
 
     @abstractmethod
     def __init__(self, rule: str, methods: Iterable[str], target: Callable[..., Any], options: MutableMapping):
         pass
 
+    @property
+    def handler(self) -> Callable:
+        """
+        The callable returned by the router. It's the :attr:`target` wrapped by the route scoped features,
+        see :func:`freesia.app.Freesia.compose_route`. It's the :attr:`target` if not set.
+        """
+        return self._handler or self.target
+
+    @handler.setter
+    def handler(self, handler: Callable) -> None:
+        self._handler = handler
+
     @abstractmethod
     def set_filter(self, name: str, url_filter: Tuple[str, Callable, Callable]):
         pass
@@ -66,6 +93,18 @@ class AbstractRouter(ABC):
     def get(self, rule: str, method: str) -> Tuple[Callable[..., Any], Tuple]:
         pass
 
+    def invalidate(self) -> None:
+        """
+        Called when the route table has been changed. Routers that cache the matching results
+        should drop them here.
+        """
+
+    def freeze(self) -> None:
+        """
+        Called once before serving. Routers can compile their structures here and reject the
+        routes added afterwards.
+        """
+
 
 class Route(AbstractRoute):
     """
@@ -84,6 +123,7 @@ class Route(AbstractRoute):
         "int": (r'-?\d+', int, lambda s: str(int(s))),
         "float": (r'-?[\d.]+', int, lambda s: str(float(s))),
         'str': (r'[^/]+', str, str),
+        'path': (r'.+', str, str),
     }
     url_filters['default'] = url_filters["str"]
 
@@ -91,17 +131,24 @@ class Route(AbstractRoute):
         # sometimes we might recombine the cls so we display the class that specified for use.
         super(self.__class__, self).__init__(rule, methods, target, options)
 
-        if not iscoroutinefunction(target):
-            raise ValueError("The route function `{}` should be awaitable.".format(target.__name__))
         if isinstance(methods, str):
             raise ValueError("The param `methods` should be wrapped with the container.")
+        if options.get("offload") and iscoroutinefunction(target):
+            raise ValueError("The offloaded route function `{}` should not be awaitable.".format(target.__name__))
+        for m in options.get("middleware", ()):
+            if not iscoroutinefunction(m):
+                raise ValueError("Middleware {} should be awaitable.".format(m.__name__))
 
         self.rule = rule
         methods = map(lambda s: s.upper(), methods)
         self.methods = set(methods)
         self.target = target
+        self.options = options
+        self.handler = target
+        self.middleware = tuple(options.get("middleware", ()))
         self.endpoint = target.__name__
         self.regex_pattern = ""
+        self.regex = None
         self.in_filters = {}
         self.builder = []
 
@@ -174,6 +221,15 @@ class Route(AbstractRoute):
                 self.in_filters[name] = in_filter
                 self.builder.append((name, out_filter))
 
+    def compile(self):
+        """
+        Compile the :attr:`regex_pattern` then store in :attr:`regex`.
+
+        :return: the compiled regex
+        """
+        self.regex = re.compile(self.regex_pattern)
+        return self.regex
+
     def param_check(self) -> bool:
         """
         Check if the number of parameters matches.
@@ -196,7 +252,7 @@ class Route(AbstractRoute):
         """
         if method not in self.methods:
             return None
-        matching = re.fullmatch(self.regex_pattern, path)
+        matching = (self.regex or self.compile()).fullmatch(path)
         if matching is None:
             return None
         else:
@@ -228,13 +284,57 @@ class Route(AbstractRoute):
 
 class Router(AbstractRouter):
     """
-    Default router.
+    Linear router. The dynamic routes are matched one by one, and a miss is matched against all of them to
+    answer 405 with the ``Allow`` header. :class:`TreeRouter`, the router of the app by default, does both
+    by looking up the tree.
     """
+    param_name_syntax = re.compile(r"\(\?P<[a-zA-Z_][a-zA-Z_0-9]*>")
 
     def __init__(self):
         self.static_url_map = {}
         self.method_map = {}
         self.endpoint_map = {}
+        #: the methods allowed by each url pattern, filled when the routes are added.
+        self.allow_map = {}
+        #: a route of each dynamic url pattern, whose compiled regex is used to find the allowed methods.
+        self.dynamic_patterns = {}
+        self.frozen = False
+        self._options_handlers = {}
+
+    @staticmethod
+    def allowed_methods(methods: Iterable[str]) -> set:
+        """
+        Get the methods that should be listed in the ``Allow`` header.
+        ``HEAD`` is served by the ``GET`` route and ``OPTIONS`` is answered automatically.
+
+        :param methods: the methods of the route
+        :return: A set of the allowed methods.
+        """
+        allowed = set(methods)
+        if "GET" in allowed:
+            allowed.add("HEAD")
+        allowed.add("OPTIONS")
+        return allowed
+
+    def options_handler(self, allowed: Iterable[str]) -> Callable:
+        """
+        Get the handler that answers the ``OPTIONS`` request with the ``Allow`` header,
+        without calling the user's handler.
+
+        :param allowed: the allowed methods
+        :return: A handler function.
+        """
+        allow = ",".join(sorted(allowed))
+        try:
+            return self._options_handlers[allow]
+        except KeyError:
+            pass
+
+        async def options(request, *params):
+            return web.Response(status=204, headers={"Allow": allow})
+
+        self._options_handlers[allow] = options
+        return options
 
     def add_route(self, route: Route) -> None:
         """
@@ -243,18 +343,56 @@ class Router(AbstractRouter):
         :param route: the instance of the :class:`Route`
         :return: None
         """
+        if self.frozen:
+            raise RuntimeError("The router has been frozen, the route {} can't be added.".format(route.rule))
         self.endpoint_map.setdefault(route.endpoint, [])
         self.endpoint_map[route.endpoint].append(route)
+        self.allow_map.setdefault(route.regex_pattern, set())
+        self.allow_map[route.regex_pattern].update(self.allowed_methods(route.methods))
 
         if route.is_static:
             self.static_url_map.setdefault(route.regex_pattern, [])
             self.static_url_map[route.regex_pattern].append(route)
         else:
+            self.dynamic_patterns.setdefault(route.regex_pattern, route)
             for m in route.methods:
                 m = m.upper()
                 self.method_map.setdefault(m, [])
                 self.method_map[m].append(route)
 
+    def not_matched(self, method: str, allowed: Union[None, set]) -> Tuple[Callable, Tuple]:
+        """
+        Handle the request whose method is not accepted by the routes matching the path.
+
+        :param method: the method of the request
+        :param allowed: the allowed methods of the path, ``None`` if no route matches the path.
+        :return: the ``OPTIONS`` handler, otherwise throw a exception.
+        """
+        if not allowed:
+            raise web.HTTPNotFound()
+        if method == "OPTIONS":
+            return self.options_handler(allowed), tuple()
+        raise web.HTTPMethodNotAllowed(method, allowed)
+
+    def freeze(self) -> None:
+        """
+        Compile all the routes and check the conflicts. No route can be added after freezing.
+
+        :return: None
+        """
+        registered = {}
+        for routes in self.endpoint_map.values():
+            for route in routes:
+                # the routes differing only in the names of the params match the same urls
+                pattern = self.param_name_syntax.sub("(", route.regex_pattern)
+                for m in route.methods:
+                    conflict = registered.setdefault((pattern, m), route)
+                    if conflict is not route:
+                        raise ValueError("The rule {} with method {} is registered by both {} and {}.".format(
+                            route.rule, m, conflict.endpoint, route.endpoint))
+                route.compile()
+        self.frozen = True
+
     def get_from_static_url(self, path: str, method: str) -> Tuple[Callable, Tuple]:
         """
         Match the static url. Throw a exception if not matches.
@@ -266,19 +404,23 @@ class Router(AbstractRouter):
         if path not in self.static_url_map:
             raise web.HTTPNotFound()
 
-        allowed_methods = set()
-        for route in self.static_url_map[path]:
-            for m in route.methods:
-                allowed_methods.add(m)
+        routes = self.static_url_map[path]
+        for route in routes:
             if method in route.methods:
-                return route.target, tuple()
-        else:
-            raise web.HTTPMethodNotAllowed(method, allowed_methods)
+                return route.handler, tuple()
+        if method == "HEAD":
+            for route in routes:
+                if "GET" in route.methods:
+                    return route.handler, tuple()
+        return self.not_matched(method, self.allow_map[path])
 
     def get(self, path: str, method: str) -> Tuple[Callable, Tuple]:
         """
         Match giving path. Throw a exception if not matches.
 
+        A miss matches the path against the compiled regex of every dynamic pattern to tell 405 from 404
+        and build the ``Allow`` header. Only :class:`TreeRouter` answers them without scanning the routes.
+
         :param path: incoming path.
         :param method: the method of the request.
         :return: A tuple include the handler function and the params.
@@ -286,22 +428,17 @@ class Router(AbstractRouter):
         if path in self.static_url_map:
             return self.get_from_static_url(path, method)
 
-        if method not in self.method_map:
-            raise web.HTTPNotFound()
-
-        for r in self.method_map[method]:
-            params = r.match(path, method)
-            if params:
-                return r.target, params
+        for m in (method, "GET") if method == "HEAD" else (method,):
+            for r in self.method_map.get(m, ()):
+                params = r.match(path, m)
+                if params is not None:
+                    return r.handler, params
 
-        allowed_methods = set()
-        for r in itertools.chain(*self.method_map.values()):
-            if r.match(path, method):
-                allowed_methods.add(r.method)
-        if allowed_methods:
-            raise web.HTTPMethodNotAllowed(method, allowed_methods)
-
-        raise web.HTTPNotFound()
+        allowed = set()
+        for pattern, route in self.dynamic_patterns.items():
+            if (route.regex or route.compile()).fullmatch(path):
+                allowed.update(self.allow_map[pattern])
+        return self.not_matched(method, allowed)
 
     def build_url(self, endpoint, params) -> str:
         if endpoint not in self.endpoint_map:
@@ -312,3 +449,293 @@ class Router(AbstractRouter):
             except ValueError:
                 continue
         raise ValueError("Params have invalid value.")
+
+
+class TreeNode:
+    """
+    A node of the :class:`TreeRouter`. Each node stands for one path segment.
+    """
+    __slots__ = ("static", "dynamic", "tails", "routes", "allowed")
+
+    def __init__(self):
+        #: children keyed by the literal segment
+        self.static = {}
+        #: children matched by a segment regex, sorted by priority
+        self.dynamic = []
+        #: catch-all children matched against the rest of the path, sorted by priority
+        self.tails = []
+        #: routes ending at this node, keyed by the method
+        self.routes = {}
+        #: all the methods accepted by the routes ending at this node
+        self.allowed = set()
+
+
+class TreeRouter(Router):
+    """
+    Segment based router. Dynamic routes are stored in a tree whose nodes are split by ``/``,
+    so the cost of matching grows with the depth of the path instead of the number of routes.
+
+    Literal segments are looked up by dict. Segments containing params are tried in a deterministic
+    order: segments mixing literal text and params first, then by the priority of the url filter
+    (see :attr:`filter_priority`), then by the registration order. Params whose regex can span ``/``
+    are matched against the rest of the path after all the other children failed.
+    """
+    #: Priority of the url filters. Lower is tried first. Filters which are not listed here
+    #: (e.g. the custom ones) use :attr:`custom_filter_priority`.
+    filter_priority = {
+        "int": 10,
+        "float": 20,
+        "str": 40,
+        "default": 40,
+    }
+    custom_filter_priority = 30
+
+    def __init__(self):
+        super().__init__()
+        self.root = TreeNode()
+        self._seq = 0
+
+    @staticmethod
+    def spans_segments(regex: str) -> bool:
+        """
+        Check if the param regex may match a ``/``.
+
+        :param regex: regex of the url filter
+        :return: bool
+        """
+        if "/" in regex.replace("[^/]", ""):
+            return True
+        return any(m.end() > m.start() for m in re.finditer(regex, "/"))
+
+    @classmethod
+    def split_rule(cls, route: Route) -> List[List[Tuple[str, Union[None, str]]]]:
+        """
+        Split the rule of the route into segments. Each segment is a list of tokens, the same
+        as the ones generated by :func:`Route.iter_token`.
+
+        :param route: the instance of the :class:`Route`
+        :return: A list of the segments.
+        """
+        segments = [[]]
+        for token, name in route.iter_token(route.rule):
+            if name is not None:
+                segments[-1].append((token, name))
+                continue
+            pieces = token.split("/")
+            if pieces[0]:
+                segments[-1].append((pieces[0], None))
+            for piece in pieces[1:]:
+                segments.append([(piece, None)] if piece else [])
+        return segments
+
+    def make_pattern(self, tokens: Iterable[Tuple[str, Union[None, str]]],
+                     url_filters: MutableMapping) -> Tuple[str, Tuple, Tuple]:
+        """
+        Build the regex of the tokens. The names of the groups are replaced by the position,
+        so the routes using different param names can share the same node.
+
+        :return: A tuple include the regex, the group names and the priority.
+        """
+        pattern, names, weight, literal = "", [], 0, False
+        for token, name in tokens:
+            if name is None:
+                pattern += re.escape(token)
+                literal = literal or bool(token)
+            else:
+                group = "p%d" % len(names)
+                pattern += "(?P<%s>%s)" % (group, url_filters[token][0])
+                names.append(group)
+                weight = max(weight, self.filter_priority.get(token, self.custom_filter_priority))
+        return pattern, tuple(names), (not literal, weight)
+
+    def add_route(self, route: Route) -> None:
+        """
+        Add a route to the router. Static routes are stored in :attr:`static_url_map`,
+        the dynamic ones are inserted into the tree.
+
+        :param route: the instance of the :class:`Route`
+        :return: None
+        """
+        super().add_route(route)
+        if route.is_static:
+            return
+
+        filters = route.url_filters
+        segments = self.split_rule(route)
+        node = self.root
+        for index, tokens in enumerate(segments):
+            if any(name is not None and self.spans_segments(filters[token][0]) for token, name in tokens):
+                rest = list(tokens)
+                for seg in segments[index + 1:]:
+                    rest.append(("/", None))
+                    rest.extend(seg)
+                node = self._insert(node.tails, rest, filters)
+                break
+            if all(name is None for _, name in tokens):
+                literal = "".join(token for token, _ in tokens)
+                node = node.static.setdefault(literal, TreeNode())
+            else:
+                node = self._insert(node.dynamic, tokens, filters)
+
+        for m in route.methods:
+            node.routes.setdefault(m, route)
+        node.allowed.update(self.allowed_methods(route.methods))
+
+    def _insert(self, children: List, tokens: List, url_filters: MutableMapping) -> TreeNode:
+        pattern, names, priority = self.make_pattern(tokens, url_filters)
+        for child in children:
+            if child[2] == pattern:
+                return child[4]
+        self._seq += 1
+        node = TreeNode()
+        children.append((priority, self._seq, pattern, (re.compile(pattern), names), node))
+        children.sort(key=lambda c: (c[0], c[1]))
+        return node
+
+    def _match(self, node: TreeNode, parts: List[str], index: int, method: str, values: List[str],
+               allowed: set) -> Union[None, Tuple[Route, List[str]]]:
+        if index == len(parts):
+            if method in node.routes:
+                return node.routes[method], values
+            if method == "HEAD" and "GET" in node.routes:
+                return node.routes["GET"], values
+            allowed.update(node.allowed)
+            return None
+
+        seg = parts[index]
+        child = node.static.get(seg)
+        if child is not None:
+            found = self._match(child, parts, index + 1, method, values, allowed)
+            if found is not None:
+                return found
+
+        for _, _, _, (regex, names), child in node.dynamic:
+            matching = regex.fullmatch(seg)
+            if matching is None:
+                continue
+            found = self._match(child, parts, index + 1, method, values + [matching.group(n) for n in names],
+                                allowed)
+            if found is not None:
+                return found
+
+        if node.tails:
+            rest = "/".join(parts[index:])
+            for _, _, _, (regex, names), child in node.tails:
+                matching = regex.fullmatch(rest)
+                if matching is None:
+                    continue
+                found = self._match(child, parts, len(parts), method, values + [matching.group(n) for n in names],
+                                    allowed)
+                if found is not None:
+                    return found
+        return None
+
+    def get(self, path: str, method: str) -> Tuple[Callable, Tuple]:
+        """
+        Match giving path. Throw a exception if not matches.
+
+        :param path: incoming path.
+        :param method: the method of the request.
+        :return: A tuple include the handler function and the params.
+        """
+        if path in self.static_url_map:
+            return self.get_from_static_url(path, method)
+
+        allowed = set()
+        found = self._match(self.root, path.split("/"), 0, method, [], allowed)
+        if found is None:
+            return self.not_matched(method, allowed)
+
+        route, values = found
+        params = []
+        for in_filter, v in zip(route.in_filters.values(), values):
+            try:
+                params.append(in_filter(v) if in_filter else v)
+            except ValueError:
+                raise web.HTTPBadRequest()
+        return route.handler, params
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class DispatchCache(AbstractRouter):
+    """
+    A bounded LRU cache placed in front of another router. The results of :func:`AbstractRouter.get`
+    are cached by ``(method, path)``, so the repeated requests skip the matching and the param converting.
+    Use :func:`freesia.app.Freesia.enable_dispatch_cache` to turn it on.
+
+    :param router: The router to be wrapped.
+    :param maxsize: The max number of the cached results.
+    :param cache_negative: Whether the 404 and 405 results should be cached too.
+    """
+
+    def __init__(self, router: AbstractRouter, maxsize: int = 1024, cache_negative: bool = True):
+        if maxsize <= 0:
+            raise ValueError("The param `maxsize` should be positive.")
+        self.router = router
+        self.maxsize = maxsize
+        self.cache_negative = cache_negative
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def __getattr__(self, item):
+        return getattr(self.router, item)
+
+    def add_route(self, route: AbstractRoute) -> None:
+        self.router.add_route(route)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+        self.router.invalidate()
+
+    def freeze(self) -> None:
+        self.router.freeze()
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def get(self, path: str, method: str) -> Tuple[Callable, Tuple]:
+        """
+        Match giving path from the cache first. Throw a exception if not matches.
+
+        :param path: incoming path.
+        :param method: the method of the request.
+        :return: A tuple include the handler function and the params.
+        """
+        key = (method, path)
+        try:
+            res = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            if res[0] is None:
+                raise res[1](**res[2])
+            return res
+
+        self.misses += 1
+        try:
+            target, params = self.router.get(path, method)
+            res = (target, tuple(params))
+        except web.HTTPMethodNotAllowed as exc:
+            if not self.cache_negative:
+                raise
+            res = (None, web.HTTPMethodNotAllowed, {"method": exc.method, "allowed_methods": exc.allowed_methods})
+            self._store(key, res)
+            raise
+        except web.HTTPNotFound:
+            if not self.cache_negative:
+                raise
+            self._store(key, (None, web.HTTPNotFound, {}))
+            raise
+        self._store(key, res)
+        return res
+
+    def _store(self, key: Tuple[str, str], res: Tuple) -> None:
+        self._cache[key] = res
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
@@ -0,0 +1,93 @@
+"""
+This module implements the server handle and the event loop policy helpers of the web framework.
+"""
+import asyncio
+from typing import Any, Union
+
+from aiohttp import web
+
+
+def install_loop_policy(policy: Union[None, str, asyncio.AbstractEventLoopPolicy]) -> None:
+    """
+    Install the event loop policy used by :func:`freesia.app.Freesia.run`.
+
+    :param policy: ``None`` or ``"asyncio"`` keeps the default policy. ``"uvloop"`` uses uvloop and
+                   fails if it's not installed. ``"auto"`` uses uvloop when it's installed.
+                   An instance of :class:`asyncio.AbstractEventLoopPolicy` is installed directly.
+    :return: None
+    """
+    if policy is None or policy == "asyncio":
+        return
+    if isinstance(policy, asyncio.AbstractEventLoopPolicy):
+        asyncio.set_event_loop_policy(policy)
+        return
+    if policy not in ("uvloop", "auto"):
+        raise ValueError("Unknown event loop policy {}.".format(policy))
+    try:
+        import uvloop
+    except ImportError:
+        if policy == "uvloop":
+            raise RuntimeError("The event loop policy `uvloop` is asked, but uvloop is not installed.")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+class ServerHandle:
+    """
+    The handle returned by :func:`freesia.app.Freesia.serve`. Await it (or :func:`wait`) to block until
+    the server is stopped, and call :func:`stop` to stop it cleanly.
+
+    :param app: The instance of :class:`freesia.app.Freesia`.
+    :param runner: The instance of :class:`aiohttp.web.ServerRunner`.
+    :param site: The instance of :class:`aiohttp.web.TCPSite`.
+    """
+
+    def __init__(self, app: Any, runner: web.ServerRunner, site: web.TCPSite):
+        self.app = app
+        self.runner = runner
+        self.site = site
+        self._stopped = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def sockets(self) -> list:
+        """
+        The listening sockets.
+        """
+        server = getattr(self.site, "_server", None)
+        return list(server.sockets) if server is not None else []
+
+    @property
+    def port(self) -> int:
+        """
+        The bound port, useful when serving on the port ``0``.
+        """
+        return self.sockets[0].getsockname()[1]
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    async def stop(self) -> None:
+        """
+        Close the listening sockets, finish the running requests, then call
+        :func:`freesia.app.Freesia.shutdown`.
+        """
+        if self._stopping:
+            await self._stopped.wait()
+            return
+        self._stopping = True
+        try:
+            await self.runner.cleanup()
+            await self.app.shutdown()
+        finally:
+            self._stopped.set()
+
+    async def wait(self) -> None:
+        """
+        Wait until the server is stopped.
+        """
+        await self._stopped.wait()
+
+    def __await__(self):
+        return self.wait().__await__()
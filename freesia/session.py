@@ -1,21 +1,39 @@
 """
 This module implements the cookie based async session.
 """
-from collections import abc
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import warnings
+import zlib
+from collections import abc, OrderedDict
 from abc import ABC, abstractmethod
-from typing import MutableMapping, Callable
+from typing import MutableMapping, Callable, Union, Sequence, Any, Dict, Optional
 
 from aiohttp.web import BaseRequest
 from aiohttp import web
 
-from .utils import asy_json_dump, asy_json_load, Response
+from . import utils
+from .utils import asy_json_dump, asy_json_load, Response, block_pool_exc
 from .app import Freesia
+from .group import Group
+
+logger = logging.getLogger(__name__)
 
 
 class Session(abc.MutableMapping):
     """
     A dict like object to represent the session attribute.
     """
+    #: the id of the session, only used by the server side session
+    sid = None
 
     def __init__(self, data: MutableMapping = None, max_age: float = None):
         self._mapping = {}
@@ -124,6 +142,402 @@ class SimpleCookieSession(SessionInterface):
         return Session(await self.json_decoder(self.load_cookie(request)))
 
 
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SignedCookieSession(SimpleCookieSession):
+    """
+    Cookie session signed by HMAC. The payload is compressed if it's larger than the threshold, to keep the
+    cookie header small. The payload is encoded and decoded inline without the thread pool, since it's small.
+    The decoded sessions are cached by the cookie value, so the repeated requests skip both the signature
+    verification and the decoding. See example::
+
+        set_up_session(app, partial(SignedCookieSession, secret_key=["new key", "old key"]))
+
+    The cookie value is ``[.]payload.timestamp.signature``, the leading ``.`` means the payload is compressed.
+
+    :param secret_key: The key to sign the cookie, or a sequence of the keys for the rotation. The first one
+                       is used to sign, all of them are used to verify.
+    :param compress_threshold: The min size of the payload to be compressed.
+    :param cache_size: The max number of the cached sessions. ``0`` disables the cache.
+    :param digestmod: The digest used by HMAC.
+    """
+
+    def __init__(self, secret_key: Union[str, bytes, Sequence[Union[str, bytes]]], *,
+                 cookie_name: str = "FREESIA_SESSION", domain: str = None, max_age: float = None,
+                 path: str = "/", secure: bool = False, httponly: bool = True, compress_threshold: int = 256,
+                 cache_size: int = 1024, digestmod: Callable = hashlib.sha256):
+        super().__init__(cookie_name=cookie_name, domain=domain, max_age=max_age, path=path, secure=secure,
+                         httponly=httponly)
+        if isinstance(secret_key, (str, bytes)):
+            secret_key = [secret_key]
+        if not secret_key:
+            raise ValueError("The param `secret_key` should not be empty.")
+        self.secret_keys = [k.encode("utf-8") if isinstance(k, str) else k for k in secret_key]
+        self.compress_threshold = compress_threshold
+        self.cache_size = cache_size
+        self.digestmod = digestmod
+        self._cache = OrderedDict()
+
+    def sign(self, value: str, key: bytes) -> str:
+        return b64encode(hmac.new(key, value.encode("ascii"), self.digestmod).digest())
+
+    def encode(self, data: MutableMapping) -> str:
+        """
+        Encode and sign the session data.
+        """
+        payload = utils.json_dumps(data)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        prefix = ""
+        if len(payload) >= self.compress_threshold:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                payload, prefix = compressed, "."
+        value = "{}{}.{}".format(prefix, b64encode(payload), int(time.time()))
+        return "{}.{}".format(value, self.sign(value, self.secret_keys[0]))
+
+    def decode(self, cookie: str) -> Union[None, bytes]:
+        """
+        Verify the cookie and get the JSON payload. None if the cookie is invalid or expired.
+        """
+        value, _, signature = cookie.rpartition(".")
+        if not value:
+            return None
+        try:
+            if not any(hmac.compare_digest(self.sign(value, key), signature) for key in self.secret_keys):
+                return None
+            payload, _, timestamp = value.rpartition(".")
+            if self.max_age is not None and time.time() - int(timestamp) > self.max_age:
+                return None
+            if payload.startswith("."):
+                return zlib.decompress(b64decode(payload[1:]))
+            return b64decode(payload)
+        except (ValueError, zlib.error):
+            return None
+
+    def expires(self, cookie: str) -> float:
+        if self.max_age is None:
+            return float("inf")
+        return int(cookie.rsplit(".", 2)[-2]) + self.max_age
+
+    def cache(self, cookie: str, data: Any, payload: bytes) -> None:
+        if not self.cache_size:
+            return
+        # the flat data can be shared, since the session copies it. Otherwise the payload is cached,
+        # so it's decoded into new objects every time.
+        flat = all(v is None or isinstance(v, (str, int, float, bool)) for v in data.values())
+        if not flat and payload is None:
+            return
+        self._cache[cookie] = (self.expires(cookie), dict(data) if flat else None, payload)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def save_session(self, request: BaseRequest, resposne: Response, session: Session):
+        data = session._get_session_data()
+        if not data:
+            self.save_cookie(resposne, None)
+            return
+        cookie = self.encode(data)
+        self.save_cookie(resposne, cookie)
+        self.cache(cookie, data, None)
+
+    async def load_session(self, request: BaseRequest) -> Session:
+        cookie = request.cookies.get(self.cookie_name)
+        if not cookie:
+            return Session()
+
+        cached = self._cache.get(cookie)
+        if cached is not None:
+            if cached[0] < time.time():
+                del self._cache[cookie]
+            else:
+                self._cache.move_to_end(cookie)
+                if cached[1] is not None:
+                    return Session(cached[1])
+                if cached[2] is not None:
+                    return Session(utils.json_loads(cached[2]))
+
+        payload = self.decode(cookie)
+        if payload is None:
+            return Session()
+        try:
+            data = utils.json_loads(payload)
+        except ValueError:
+            return Session()
+        if not isinstance(data, dict):
+            return Session()
+        self.cache(cookie, data, payload)
+        return Session(data)
+
+
+class SessionStore(ABC):
+    """
+    Abstract storage of :class:`ServerSideSession`. The data is stored as JSON text keyed by the session id.
+    """
+
+    @abstractmethod
+    async def get(self, sid: str) -> Optional[str]:
+        """
+        Get the data of the session, None if it doesn't exist or has expired.
+        """
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, Optional[str]]) -> None:
+        """
+        Write a batch of sessions. The session is deleted if the data is None.
+        """
+
+
+class MemoryStore(SessionStore):
+    """
+    In-memory session store. The least recently used sessions are dropped when the store is full.
+
+    The store lives in the memory of one process. If the app is served by several workers, each worker only
+    sees the sessions saved by itself, so use a shared store such as :class:`SQLiteStore` instead.
+
+    :param max_entries: The max number of the stored sessions.
+    :param ttl: The seconds the session is kept after the last write, None to keep it forever.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        #: the id of the process creating the store, see :func:`ServerSideSession.start`
+        self.pid = os.getpid()
+
+    async def get(self, sid: str) -> Optional[str]:
+        item = self._data.get(sid)
+        if item is None:
+            return None
+        expires, data = item
+        if expires < time.time():
+            del self._data[sid]
+            return None
+        self._data.move_to_end(sid)
+        return data
+
+    async def set_many(self, items: Dict[str, Optional[str]]) -> None:
+        expires = float("inf") if self.ttl is None else time.time() + self.ttl
+        for sid, data in items.items():
+            if data is None:
+                self._data.pop(sid, None)
+                continue
+            self._data[sid] = (expires, data)
+            self._data.move_to_end(sid)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class SQLiteStore(SessionStore):
+    """
+    Session store backed by a local SQLite database. The queries are run in the thread pool.
+    The connection is opened on the first query of each process, so the workers forked by
+    :func:`freesia.app.Freesia.run` don't share it.
+
+    :param path: The path of the database file.
+    :param ttl: The seconds the session is kept after the last write, None to keep it forever.
+    :param table: The name of the table.
+    """
+
+    def __init__(self, path: str, ttl: float = None, table: str = "freesia_session"):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The connection of the current process. Call it with :attr:`_lock` held.
+        """
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            # the connection inherited from the parent process is dropped without closing it.
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = pid
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS {} (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)".format(
+                        self.table)
+                )
+        return self._conn
+
+    def _get(self, sid: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM {} WHERE sid = ? AND (expires IS NULL OR expires > ?)".format(self.table),
+                (sid, time.time())
+            ).fetchone()
+        return row and row[0]
+
+    def _set_many(self, items: Dict[str, Optional[str]]) -> None:
+        now = time.time()
+        expires = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            conn = self.conn
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO {} (sid, data, expires) VALUES (?, ?, ?)".format(self.table),
+                    [(sid, data, expires) for sid, data in items.items() if data is not None]
+                )
+                conn.executemany(
+                    "DELETE FROM {} WHERE sid = ?".format(self.table),
+                    [(sid,) for sid, data in items.items() if data is None]
+                )
+                conn.execute("DELETE FROM {} WHERE expires <= ?".format(self.table), (now,))
+
+    async def get(self, sid: str) -> Optional[str]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(block_pool_exc, self._get, sid)
+
+    async def set_many(self, items: Dict[str, Optional[str]]) -> None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(block_pool_exc, self._set_many, items)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class ServerSideSession(SessionInterface):
+    """
+    Session stored on the server. The cookie only keeps the session id. The modified sessions are
+    buffered and written to the store in batches by a background task, the buffered ones are served
+    before reading the store. The store is only read when :func:`get_session` is called. See example::
+
+        set_up_session(app, partial(ServerSideSession, SQLiteStore("session.db", ttl=86400)))
+
+    :param store: The :class:`SessionStore`. Defaults to a :class:`MemoryStore` using `max_age` as the ttl,
+                  which is not shared by the workers, see :class:`MemoryStore`.
+    :param flush_interval: The seconds between two flushes. ``0`` writes the session to the store immediately.
+                           The failed flushes are logged and retried with the interval doubled each time.
+    """
+    max_sid_length = 128
+    #: the max seconds between two retries of the failed flush
+    max_retry_interval = 60.0
+    #: the buffered sessions are written by the request saving the session once the buffer reaches it,
+    #: so the buffer can't grow without limit if the store keeps failing
+    max_pending = 10000
+
+    def __init__(self, store: SessionStore = None, *, flush_interval: float = 0.5,
+                 cookie_name: str = "FREESIA_SESSION", domain: str = None, max_age: float = None,
+                 path: str = "/", secure: bool = False, httponly: bool = True,
+                 json_encoder: Callable = asy_json_dump, json_decoder: Callable = asy_json_load):
+        super().__init__(cookie_name=cookie_name, domain=domain, max_age=max_age, path=path, secure=secure,
+                         httponly=httponly, json_encoder=json_encoder, json_decoder=json_decoder)
+        self.store = store if store is not None else MemoryStore(ttl=max_age)
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._flushing = {}
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    @staticmethod
+    def new_sid() -> str:
+        return secrets.token_urlsafe(32)
+
+    async def new_session(self) -> Session:
+        session = Session()
+        session.sid = self.new_sid()
+        return session
+
+    async def load_session(self, request: BaseRequest) -> Session:
+        sid = request.cookies.get(self.cookie_name)
+        if not sid or len(sid) > self.max_sid_length:
+            return await self.new_session()
+        if sid in self._pending:
+            data = self._pending[sid]
+        elif sid in self._flushing:
+            data = self._flushing[sid]
+        else:
+            data = await self.store.get(sid)
+        if data is None:
+            return await self.new_session()
+        session = Session(await self.json_decoder(data))
+        session.sid = sid
+        session._new = False
+        return session
+
+    async def save_session(self, request: BaseRequest, resposne: Response, session: Session):
+        sid = session.sid or self.new_sid()
+        data = session._get_session_data()
+        param = self._cookie_params
+        if not data:
+            self._pending[sid] = None
+            resposne.del_cookie(self.cookie_name, domain=param["domain"], path=param["path"])
+        else:
+            self._pending[sid] = await self.json_encoder(data)
+            if session.new or self.max_age is not None:
+                resposne.set_cookie(self.cookie_name, sid, **param)
+        if self.flush_interval <= 0 or len(self._pending) >= self.max_pending:
+            await self.flush()
+        elif self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def flush(self) -> None:
+        """
+        Write the buffered sessions to the store. They are kept in the buffer if the write fails.
+        The flushes are serialized, so the batch being written is always visible to :func:`load_session`
+        and the batches are written in order.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self.store.set_many(self._flushing)
+            except Exception:
+                for sid, data in self._flushing.items():
+                    self._pending.setdefault(sid, data)
+                raise
+            finally:
+                self._flushing = {}
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            await asyncio.sleep(min(self.flush_interval * 2 ** failures, self.max_retry_interval))
+            try:
+                await self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.exception("Failed to write %d sessions to the store, retry #%d.", len(self._pending),
+                                 failures)
+
+    async def start(self, app: Any = None) -> None:
+        """
+        Start the background flushing task. It's also started by the first saved session.
+        A warning is emitted if the :class:`MemoryStore` was created in another process, i.e. the app
+        is served by the forked workers, which don't share the sessions.
+        """
+        if isinstance(self.store, MemoryStore) and self.store.pid != os.getpid():
+            warnings.warn("The MemoryStore is not shared by the worker processes, each worker only sees "
+                          "the sessions saved by itself. Use a shared store such as SQLiteStore.", RuntimeWarning)
+        if self.flush_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self, app: Any = None) -> None:
+        """
+        Stop the background flushing task and write the rest sessions.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
 SESSION_KEY = "freesia_session"
 SESSION_INTERFACE_KEY = "freesia_session_interface"
 
@@ -160,11 +574,26 @@ async def new_session(request: BaseRequest) -> Session:
     return session
 
 
-def set_up_session(app: Freesia, session_interface: Callable):
+def set_up_session(app: Union[Freesia, Group], session_interface: Callable):
     """
-    Setup the session middleware to the app.
+    Setup the session middleware to the app. Pass a :class:`freesia.group.Group` instead of the app
+    to use the session only in the routes of the group, before the group is registered. If the interface
+    has ``start`` and ``stop`` methods, they're added to the startup and shutdown hooks of the app,
+    the one registering the group if a group is passed.
     """
     session_interface = session_interface()
+    if hasattr(session_interface, "start"):
+        def add_hooks(target):
+            target.on_startup.append(session_interface.start)
+            target.on_shutdown.append(session_interface.stop)
+
+        if isinstance(app, Freesia):
+            add_hooks(app)
+        else:
+            if app.registered:
+                raise RuntimeError("The group `{}` has been registered, set up the session before it.".format(
+                    app.name))
+            app.record(lambda s: add_hooks(s.app))
 
     async def session_middleware(request, handler):
         request[SESSION_INTERFACE_KEY] = session_interface
@@ -175,7 +604,7 @@ def set_up_session(app: Freesia, session_interface: Callable):
             res = exc
             handle_error = True
         session = request.get(SESSION_KEY)
-        if session and session.modified:
+        if session is not None and session.modified:
             await session_interface.save_session(request, res, session)
         if handle_error:
             raise res
@@ -0,0 +1,241 @@
+"""
+This module implements the static file serving of the web framework.
+"""
+import asyncio
+import mimetypes
+import os
+import stat
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Union, Tuple
+
+from aiohttp import web
+
+from .utils import block_pool_exc
+
+
+class SendfileResponse(web.StreamResponse):
+    """
+    Stream a part of the file with :func:`asyncio.AbstractEventLoop.sendfile`, which uses the ``sendfile``
+    syscall when the transport supports it, and falls back to read and write otherwise. The loops not
+    implementing it, e.g. uvloop, get the chunks read in :data:`freesia.utils.block_pool_exc`.
+
+    :param path: The path of the file.
+    :param offset: The offset to start sending.
+    :param count: The number of the bytes to be sent.
+    """
+    #: the size of the chunks read when the loop doesn't implement ``sendfile``
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, offset: int, count: int, *, status: int = 200, headers=None):
+        super().__init__(status=status, headers=headers)
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.content_length = count
+
+    async def prepare(self, request: web.BaseRequest):
+        if self.prepared:
+            return await super().prepare(request)
+        writer = await super().prepare(request)
+        if request.method == "HEAD" or not self.count:
+            return writer
+
+        loop = asyncio.get_event_loop()
+        transport = request.transport
+        if transport is None:
+            raise ConnectionResetError("Connection lost")
+        f = await loop.run_in_executor(block_pool_exc, open, self.path, "rb")
+        try:
+            await writer.drain()
+            try:
+                await loop.sendfile(transport, f, self.offset, self.count)
+            except NotImplementedError:
+                await self.sendfile_fallback(writer, f)
+        finally:
+            await loop.run_in_executor(block_pool_exc, f.close)
+        return writer
+
+    async def sendfile_fallback(self, writer, f) -> None:
+        """
+        Read the file in chunks and write them to the response.
+        """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(block_pool_exc, f.seek, self.offset)
+        remaining = self.count
+        while remaining:
+            chunk = await loop.run_in_executor(block_pool_exc, f.read, min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            await writer.write(chunk)
+            remaining -= len(chunk)
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def parse_range(header: str, size: int) -> Union[None, Tuple[int, int]]:
+    """
+    Parse the single range of the ``Range`` header.
+
+    :param header: the value of the ``Range`` header
+    :param size: the size of the file
+    :return: A tuple include the start and the end (exclusive), or None if the range should be ignored.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": "bytes */%d" % size})
+            return max(size - length, 0), size
+        start = int(start)
+        end = int(end) + 1 if end else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": "bytes */%d" % size})
+    return start, min(end, size)
+
+
+class StaticFiles:
+    """
+    Serve the files under the directory. Use :func:`freesia.app.Freesia.static` to register it.
+
+    The big files are sent by :class:`SendfileResponse`. The small ones are kept in an in-memory LRU
+    cache limited by the total bytes. ``Range``, ``ETag``, ``Last-Modified`` and the conditional
+    requests are supported. The result of ``stat()`` is cached for a short time.
+
+    :param directory: The directory of the files.
+    :param cache_bytes: The max total bytes of the files kept in memory. ``0`` disables the cache.
+    :param max_cached_file: The max size of a file that can be kept in memory.
+    :param stat_ttl: The seconds to cache the result of ``stat()``.
+    :param follow_symlinks: Whether the symlinks pointing out of the directory are followed. By default the path
+                            is resolved with ``realpath`` before checking it's in the directory.
+    """
+
+    def __init__(self, directory: str, cache_bytes: int = 16 * 1024 * 1024, max_cached_file: int = 256 * 1024,
+                 stat_ttl: float = 1.0, follow_symlinks: bool = False):
+        self.directory = os.path.realpath(directory)
+        self.follow_symlinks = follow_symlinks
+        if not os.path.isdir(self.directory):
+            raise ValueError("The directory {} doesn't exist.".format(directory))
+        self.cache_bytes = cache_bytes
+        self.max_cached_file = max_cached_file
+        self.stat_ttl = stat_ttl
+        self.cached_bytes = 0
+        self._stats = {}
+        self._files = OrderedDict()
+
+    def resolve(self, filename: str) -> str:
+        """
+        Get the absolute path of the file. Throw :class:`aiohttp.web.HTTPNotFound` if the file is out of
+        the directory, including through a symlink unless :attr:`follow_symlinks` is set.
+        """
+        if "\x00" in filename:
+            raise web.HTTPNotFound()
+        path = os.path.join(self.directory, filename)
+        path = os.path.normpath(path) if self.follow_symlinks else os.path.realpath(path)
+        if not path.startswith(self.directory + os.sep):
+            raise web.HTTPNotFound()
+        return path
+
+    def stat(self, path: str) -> Union[None, os.stat_result]:
+        """
+        Get the cached result of ``stat()``. None means the file doesn't exist.
+        """
+        now = time.monotonic()
+        cached = self._stats.get(path)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if len(self._stats) >= 4096:
+            self._stats.clear()
+        self._stats[path] = (now + self.stat_ttl, st)
+        return st
+
+    async def read(self, path: str, etag: str, size: int) -> Union[None, bytes]:
+        """
+        Get the content of the small file from the memory cache, or read and cache it.
+        None means the file should not be cached.
+        """
+        if not self.cache_bytes or size > self.max_cached_file or size > self.cache_bytes:
+            return None
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == etag:
+            self._files.move_to_end(path)
+            return cached[1]
+
+        loop = asyncio.get_event_loop()
+        body = await loop.run_in_executor(block_pool_exc, read_file, path)
+        if cached is not None:
+            self.cached_bytes -= len(cached[1])
+        self._files[path] = (etag, body)
+        self._files.move_to_end(path)
+        self.cached_bytes += len(body)
+        while self.cached_bytes > self.cache_bytes:
+            _, (_, evicted) = self._files.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+        return body
+
+    @staticmethod
+    def not_modified(request: web.BaseRequest, etag: str, mtime: float) -> bool:
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return any(tag.strip() in (etag, "*", "W/" + etag) for tag in if_none_match.split(","))
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def handle(self, request: web.BaseRequest, filename: str) -> web.StreamResponse:
+        """
+        The route handler of the static files.
+        """
+        path = self.resolve(filename)
+        st = self.stat(path)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            raise web.HTTPNotFound()
+
+        size = st.st_size
+        etag = '"%x-%x"' % (st.st_mtime_ns, size)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+        }
+        if self.not_modified(request, etag, st.st_mtime):
+            return web.Response(status=304, headers=headers)
+
+        content_type, encoding = mimetypes.guess_type(path)
+        headers["Content-Type"] = content_type or "application/octet-stream"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        status, start, end = 200, 0, size
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        if range_header and (if_range is None or if_range == etag):
+            byte_range = parse_range(range_header, size)
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                headers["Content-Range"] = "bytes %d-%d/%d" % (start, end - 1, size)
+
+        body = await self.read(path, etag, size)
+        if body is not None:
+            return web.Response(status=status, body=memoryview(body)[start:end], headers=headers)
+        return SendfileResponse(path, start, end - start, status=status, headers=headers)
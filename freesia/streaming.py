@@ -0,0 +1,63 @@
+"""
+This module implements the streaming responses of the web framework.
+"""
+from typing import Any, AsyncIterable, Union
+
+from aiohttp import web
+from aiohttp.typedefs import LooseHeaders
+
+
+class StreamingResponse(web.StreamResponse):
+    """
+    Send the chunks of an async iterable, e.g. an async generator, one by one. Each chunk is written after
+    the previous one has been drained by the transport, so the memory usage doesn't grow with the size of
+    the response. The handlers can return it directly to set the status and the headers, or return the async
+    iterable and let :func:`freesia.app.Freesia.cast` build it. See example::
+
+        @app.route("/export")
+        async def export(request):
+            async def rows():
+                async for row in fetch_rows():
+                    yield row.to_csv()
+
+            return StreamingResponse(rows(), content_type="text/csv")
+
+    :param iterable: The async iterable yielding the chunks of str or bytes.
+    :param status: The status of the response.
+    :param reason: The reason of the response.
+    :param headers: The headers of the response.
+    :param content_type: The content type of the response.
+    :param charset: The charset used to encode the str chunks.
+    """
+
+    def __init__(self, iterable: AsyncIterable[Union[str, bytes]], *, status: int = 200, reason: str = None,
+                 headers: LooseHeaders = None, content_type: str = "application/octet-stream",
+                 charset: str = "utf-8"):
+        super().__init__(status=status, reason=reason, headers=headers)
+        if "Content-Type" not in self.headers:
+            self.content_type = content_type
+            if content_type.startswith("text/") or content_type.endswith("json"):
+                self.charset = charset
+        self.encoding = charset
+        self.iterable = iterable
+        self._head = False
+
+    async def prepare(self, request: web.BaseRequest) -> Any:
+        self._head = request.method == "HEAD"
+        return await super().prepare(request)
+
+    async def write_eof(self, data: bytes = b"") -> None:
+        iterable, self.iterable = self.iterable, None
+        if iterable is not None:
+            try:
+                if not self._head:
+                    async for chunk in iterable:
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode(self.encoding)
+                        if chunk:
+                            await self.write(chunk)
+            finally:
+                aclose = getattr(iterable, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        await super().write_eof(data)
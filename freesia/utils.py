@@ -1,8 +1,7 @@
 """
 Some common tools are defined in this module.
 """
-from typing import Any, Optional, Callable
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Callable, Union, Iterable, AsyncIterable, AsyncIterator
 import asyncio
 import json
 
@@ -10,22 +9,125 @@ from aiohttp.helpers import sentinel
 from aiohttp.typedefs import LooseHeaders
 from aiohttp.web import Response as aioResponse
 
+from .executor import ManagedExecutor
+from .streaming import StreamingResponse
+
 
 class Response(aioResponse):
     pass
 
 
-block_pool_exc = ThreadPoolExecutor()
+#: The thread pool shared by the blocking work of the framework. It's the ``"default"`` executor of the app.
+block_pool_exc = ManagedExecutor("default")
+
+#: The thread pool running the sync handlers and the sync methods of the views. It's the ``"sync"`` executor
+#: of the app, kept apart from :data:`block_pool_exc` so the slow handlers can't starve the framework.
+sync_pool_exc = ManagedExecutor("sync", max_workers=16)
+
+
+#: The payloads whose (estimated) size is not smaller than it are encoded and decoded in :data:`block_pool_exc`.
+#: The smaller ones are handled inline, because the thread hop costs more than the encoding.
+json_offload_size = 16 * 1024
+
+#: The functions used by :func:`asy_json_dump` and :func:`asy_json_load`. See :func:`set_json_backend`.
+json_dumps = json.dumps
+json_loads = json.loads
+
+
+def set_json_backend(backend: Union[str, tuple] = "json") -> None:
+    """
+    Set the JSON backend. See example::
+
+        set_json_backend("auto")
+        set_json_backend((my_dumps, my_loads))
 
+    :param backend: ``"json"`` uses the standard library. ``"orjson"`` or ``"ujson"`` uses the package,
+                    and fails if it's not installed. ``"auto"`` uses the first installed one of orjson and ujson,
+                    or falls back to the standard library. A tuple of ``(dumps, loads)`` is used directly,
+                    ``dumps`` can return either str or bytes.
+    :return: None
+    """
+    global json_dumps, json_loads
+    if isinstance(backend, tuple):
+        json_dumps, json_loads = backend
+        return
+    if backend not in ("json", "orjson", "ujson", "auto"):
+        raise ValueError("Unknown JSON backend {}.".format(backend))
+    for name in (("orjson", "ujson") if backend == "auto" else (backend,)):
+        if name == "json":
+            break
+        try:
+            module = __import__(name)
+        except ImportError:
+            if backend != "auto":
+                raise
+            continue
+        json_dumps, json_loads = module.dumps, module.loads
+        return
+    json_dumps, json_loads = json.dumps, json.loads
 
-async def asy_json_dump(data):
+
+def estimate_json_size(data: Any, limit: int = None) -> int:
+    """
+    Estimate the size of the encoded data roughly. It stops as soon as the estimated size reaches the limit,
+    so the cost is bounded.
+
+    :param data: the data to be encoded
+    :param limit: the limit of the estimated size. Defaults to :data:`json_offload_size`.
+    :return: the estimated size
+    """
+    if limit is None:
+        limit = json_offload_size
+    size, stack = 0, [data]
+    while stack and size < limit:
+        o = stack.pop()
+        if isinstance(o, (str, bytes)):
+            size += len(o) + 2
+        elif isinstance(o, dict):
+            size += len(o) * 4 + 2
+            if size < limit:
+                stack.extend(o.keys())
+                stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            size += len(o) * 2 + 2
+            if size < limit:
+                stack.extend(o)
+        else:
+            size += 8
+    return size
+
+
+async def _json_dump(data: Any) -> Union[str, bytes]:
+    if estimate_json_size(data) < json_offload_size:
+        return json_dumps(data)
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(block_pool_exc, lambda: json.dumps(data))
+    return await loop.run_in_executor(block_pool_exc, json_dumps, data)
+
+
+async def asy_json_dumpb(data: Any) -> bytes:
+    """
+    Encode the data to the JSON bytes. The large data is encoded in :data:`block_pool_exc`.
+    """
+    res = await _json_dump(data)
+    return res.encode("utf-8") if isinstance(res, str) else res
 
 
-async def asy_json_load(data):
+async def asy_json_dump(data: Any) -> str:
+    """
+    Encode the data to the JSON string. The large data is encoded in :data:`block_pool_exc`.
+    """
+    res = await _json_dump(data)
+    return res.decode("utf-8") if isinstance(res, bytes) else res
+
+
+async def asy_json_load(data: Union[str, bytes]) -> Any:
+    """
+    Decode the JSON string. The large string is decoded in :data:`block_pool_exc`.
+    """
+    if len(data) < json_offload_size:
+        return json_loads(data)
     loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(block_pool_exc, lambda: json.loads(data))
+    return await loop.run_in_executor(block_pool_exc, json_loads, data)
 
 
 async def jsonify(
@@ -36,17 +138,103 @@ async def jsonify(
         reason: Optional[str] = None,
         headers: LooseHeaders = None,
         content_type: str = 'application/json',
-        dumps: Callable = asy_json_dump
+        dumps: Callable = asy_json_dumpb
 ) -> Response:
+    """
+    Build the JSON response. The data is encoded by `dumps`, which may return str or bytes.
+    The bytes are used as the body directly.
+    """
+    charset = None
     if data is not sentinel:
         if text or body:
             raise ValueError(
                 "only one of data, text, or body should be specified"
             )
         else:
-            text = await dumps(data)
+            body = await dumps(data)
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            charset = "utf-8"
     return Response(text=text, body=body, status=status, reason=reason,
-                    headers=headers, content_type=content_type)
+                    headers=headers, content_type=content_type, charset=charset)
+
+
+async def iter_json_chunks(records: Union[Iterable, AsyncIterable], ndjson: bool = False,
+                           chunk_size: int = 64 * 1024, batch_size: int = 256) -> AsyncIterator[bytes]:
+    """
+    Encode the records incrementally. The records are encoded in batches to keep the per-record overhead low,
+    and the output is split into the chunks no larger than `chunk_size`.
+
+    :param records: an iterable or an async iterable of the records
+    :param ndjson: output the newline delimited JSON instead of a JSON array
+    :param chunk_size: the max size of each chunk
+    :param batch_size: the number of the records encoded together
+    :return: an async iterator of the chunks
+    """
+    buf = bytearray(b"" if ndjson else b"[")
+    first = True
+
+    def encode(batch):
+        nonlocal first
+        if ndjson:
+            for r in batch:
+                res = json_dumps(r)
+                buf.extend(res.encode("utf-8") if isinstance(res, str) else res)
+                buf.extend(b"\n")
+            return
+        # encode the whole batch as an array at once, then drop the brackets.
+        res = json_dumps(batch)[1:-1]
+        if not first:
+            buf.extend(b",")
+        first = False
+        buf.extend(res.encode("utf-8") if isinstance(res, str) else res)
+
+    async def batches():
+        batch = []
+        if hasattr(records, "__aiter__"):
+            async for r in records:
+                batch.append(r)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        else:
+            for r in records:
+                batch.append(r)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    async for batch in batches():
+        encode(batch)
+        while len(buf) >= chunk_size:
+            yield bytes(buf[:chunk_size])
+            del buf[:chunk_size]
+    if not ndjson:
+        buf.extend(b"]")
+    while buf:
+        yield bytes(buf[:chunk_size])
+        del buf[:chunk_size]
+
+
+def jsonify_stream(
+        records: Union[Iterable, AsyncIterable], *,
+        ndjson: bool = False,
+        status: int = 200,
+        reason: Optional[str] = None,
+        headers: LooseHeaders = None,
+        chunk_size: int = 64 * 1024,
+        batch_size: int = 256
+) -> StreamingResponse:
+    """
+    Build the streaming JSON response of the records, as a JSON array or the newline delimited JSON.
+    The records are encoded incrementally, so the whole output is never held in memory.
+    See :func:`iter_json_chunks`.
+    """
+    content_type = "application/x-ndjson" if ndjson else "application/json"
+    return StreamingResponse(iter_json_chunks(records, ndjson, chunk_size, batch_size), status=status,
+                             reason=reason, headers=headers, content_type=content_type)
 
 
 def redirect(url, permanent=False):
@@ -1,11 +1,15 @@
 """
 This module implements the class based view of the web framework.
 """
-from inspect import iscoroutinefunction
+import asyncio
+from functools import partial
+from inspect import iscoroutinefunction, isawaitable
 from typing import Any, Callable
 
 from aiohttp import web
 
+from .utils import sync_pool_exc
+
 HTTP_METHODS = {'get', 'post', 'head', 'options',
                 'delete', 'put', 'trace', 'patch'}
 
@@ -45,6 +49,7 @@ class View:
             for d in cls.decorator:
                 view = d(view)
 
+        view.view_class = cls
         view.methods = cls.methods
         view.__name__ = cls.__name__
         view.__doc__ = cls.__doc__
@@ -64,27 +69,38 @@ class MethodMetaView(type):
             methods = set()
             for m in HTTP_METHODS:
                 if hasattr(cls, m):
-                    if not iscoroutinefunction(getattr(cls, m)):
-                        raise ValueError("View method {}.{} should be awaitable.".format(name, m))
                     methods.add(m)
             cls.methods = methods
+        cls.sync_methods = {m for m in cls.methods if hasattr(cls, m) and not iscoroutinefunction(getattr(cls, m))}
 
 
 class MethodView(View, metaclass=MethodMetaView):
     """
-    Method based class view. See example::
+    Method based class view. The sync methods run in :attr:`executor`. See example::
 
         class MyView(MethodView):
-            def get(self, request, name):
+            async def get(self, request, name):
+                pass
+
+            def post(self, request, name):
                 pass
 
         app = Freesia()
         app.add_route("/person/<name>", MyView.as_view())
     """
+    #: the executor running the sync methods
+    executor = sync_pool_exc
 
     async def dispatch_request(self, request: web.BaseRequest, *args, **kwargs) -> Any:
         m = request.method.lower()
+        if m == "head" and m not in self.methods:
+            # the router sends HEAD to the GET route
+            m = "get"
+        if m in self.sync_methods:
+            loop = asyncio.get_event_loop()
+            res = await loop.run_in_executor(self.executor, partial(getattr(self, m), request, *args, **kwargs))
+            return await res if isawaitable(res) else res
         if m in self.methods:
             return await (getattr(self, m)(request, *args, **kwargs))
         else:
-            raise web.HTTPMethodNotAllowed(m, self.methods)
+            raise web.HTTPMethodNotAllowed(request.method, {m.upper() for m in self.methods})
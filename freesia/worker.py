@@ -0,0 +1,136 @@
+"""
+This module implements the multi-process serving of the web framework.
+"""
+import asyncio
+import os
+import signal
+import sys
+import time
+from typing import Any
+
+
+class Supervisor:
+    """
+    Fork the worker processes and keep them running. Each worker runs its own event loop and binds the same
+    port with ``SO_REUSEPORT``, so the kernel balances the connections between them. The app is frozen
+    before forking, so the workers share the compiled routes copy-on-write. It's used by
+    :func:`freesia.app.Freesia.run` when ``workers`` is more than one.
+
+    The dead workers are restarted. ``SIGINT`` and ``SIGTERM`` make the supervisor send ``SIGTERM``
+    to all workers and wait for them to exit.
+
+    :param app: The instance of :class:`freesia.app.Freesia`.
+    :param host: host
+    :param port: port
+    :param workers: The number of the worker processes.
+    :param restart_delay: The min seconds between two restarts of the same slot, to avoid the crash loop.
+    :param max_failures: The workers exiting within `restart_delay` after starting are failed. If a slot fails
+                         so many times in a row, e.g. the port is in use, all workers are stopped and
+                         :func:`run` raises :class:`RuntimeError`.
+    :param options: The server options passed to :func:`freesia.app.Freesia.serve`. ``banner`` decides
+                    whether the supervisor prints the banner, and ``reuse_port`` is always on for the workers.
+    """
+
+    def __init__(self, app: Any, host: str, port: int, workers: int, restart_delay: float = 1.0,
+                 max_failures: int = 5, **options: Any):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Multi-process serving needs `os.fork`, which is not supported on this platform.")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.restart_delay = restart_delay
+        self.max_failures = max_failures
+        #: the number of the failures in a row keyed by the slot
+        self.failures = {}
+        self.banner = options.pop("banner", True)
+        options.pop("reuse_port", None)
+        self.options = options
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, slot: int) -> None:
+        """
+        Fork a worker process for the slot.
+        """
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (slot, time.monotonic())
+            return
+
+        code = 0
+        try:
+            self.run_worker()
+        except BaseException:
+            code = 1
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def run_worker(self) -> None:
+        """
+        The entry of the worker process.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        handle = loop.run_until_complete(
+            self.app.serve(self.host, self.port, reuse_port=True, banner=False, **self.options))
+        loop.add_signal_handler(signal.SIGTERM, lambda: loop.create_task(handle.stop()))
+        try:
+            loop.run_until_complete(handle.wait())
+        finally:
+            loop.run_until_complete(handle.stop())
+            loop.close()
+
+    def stop(self, *args: Any) -> None:
+        """
+        Stop all workers gracefully.
+        """
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """
+        Start the workers and supervise them until all of them exit.
+        """
+        self.app.freeze()
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        if self.banner:
+            self.app.print_banner(self.host, self.port, self.workers)
+
+        failed_slot = None
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            slot, started = self.children.pop(pid, (None, None))
+            if slot is None or self.stopping:
+                continue
+            elapsed = time.monotonic() - started
+            if elapsed < self.restart_delay:
+                self.failures[slot] = self.failures.get(slot, 0) + 1
+                if self.failures[slot] >= self.max_failures:
+                    failed_slot = slot
+                    self.stop()
+                    continue
+                time.sleep(self.restart_delay - elapsed)
+            else:
+                self.failures[slot] = 0
+            if not self.stopping:
+                self.spawn(slot)
+        if failed_slot is not None:
+            raise RuntimeError("The worker {} failed {} times in a row right after starting, gave up.".format(
+                failed_slot, self.max_failures))
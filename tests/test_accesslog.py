@@ -0,0 +1,74 @@
+import asyncio
+import io
+import unittest
+
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import HTTPNotFound
+
+from freesia import Freesia
+from freesia.accesslog import AccessLogger
+
+
+class AccessLogTestCase(unittest.TestCase):
+    def test_drop_when_full(self):
+        logger = AccessLogger(stream=io.StringIO(), max_records=1)
+        logger.record("GET", "/", 200, 5, 0.001)
+        logger.record("GET", "/", 200, 5, 0.001)
+        self.assertEqual(logger.dropped, 1)
+
+    def test_flush(self):
+        stream = io.StringIO()
+        logger = AccessLogger(stream=stream, fmt="{method} {path} {status} {bytes}")
+        logger.record("GET", "/", 200, 5, 0.001)
+        asyncio.run(logger.flush())
+        self.assertEqual(stream.getvalue(), "GET / 200 5\n")
+
+    def test_failed_write(self):
+        class BrokenStream(io.StringIO):
+            def write(self, text):
+                raise OSError("disk full")
+
+        logger = AccessLogger(stream=BrokenStream(), fmt="{method} {path} {status} {bytes}", flush_interval=0.01)
+
+        async def main():
+            await logger.start()
+            logger.record("GET", "/", 200, 5, 0.001)
+            with self.assertLogs("freesia.accesslog", "ERROR"):
+                await asyncio.sleep(0.05)
+            self.assertFalse(logger._task.done())
+            logger.stream = io.StringIO()
+            logger.record("GET", "/", 200, 5, 0.001)
+            await asyncio.sleep(0.05)
+            await logger.stop()
+
+        asyncio.run(main())
+        self.assertEqual(logger.dropped, 1)
+        self.assertEqual(logger.stream.getvalue(), "GET / 200 5\n")
+
+    def test_app_access_log(self):
+        stream = io.StringIO()
+        app = Freesia()
+
+        @app.route("/")
+        async def index(request):
+            return "hello"
+
+        @app.route("/view")
+        async def view(request):
+            return memoryview(b"view")
+
+        self.assertEqual(app.make_handler(), app.handler)
+        logger = app.enable_access_log(stream=stream, fmt="{method} {path} {status} {bytes}")
+        handler = app.make_handler()
+
+        async def main():
+            await app.startup()
+            await handler(make_mocked_request("GET", "/"))
+            await handler(make_mocked_request("GET", "/view"))
+            with self.assertRaises(HTTPNotFound):
+                await handler(make_mocked_request("GET", "/404"))
+            await app.shutdown()
+
+        asyncio.run(main())
+        self.assertIsNone(logger._task)
+        self.assertEqual(stream.getvalue(), "GET / 200 5\nGET /view 200 4\nGET /404 404 0\n")
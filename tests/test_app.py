@@ -0,0 +1,227 @@
+import asyncio
+import unittest
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia, Response
+from freesia.route import AbstractRoute
+from freesia.server import install_loop_policy
+
+
+class FreezeTestCase(unittest.TestCase):
+    def test_freeze(self):
+        app = Freesia()
+
+        @app.route("/hello/<name>")
+        async def hello(request, name):
+            return "hello, " + name
+
+        info = app.freeze()
+        self.assertEqual(info.routes, 1)
+        self.assertTrue(app.frozen)
+        self.assertIsNotNone(app.rules[0].regex)
+        self.assertIs(app.freeze(), info)
+
+        with self.assertRaises(RuntimeError):
+            app.add_route("/other", target=hello)
+        with self.assertRaises(RuntimeError):
+            app.use([])
+
+        res = asyncio.run(app.handler(make_mocked_request("GET", "/hello/mike")))
+        self.assertEqual(res.text, "hello, mike")
+
+    def test_conflict(self):
+        app = Freesia()
+
+        @app.route("/hello")
+        async def hello(request):
+            pass
+
+        @app.route("/hello")
+        async def other(request):
+            pass
+
+        with self.assertRaises(ValueError):
+            app.freeze()
+
+    def test_conflict_param_names(self):
+        app = Freesia()
+
+        @app.route("/a/<int:x>")
+        async def first(request, x):
+            pass
+
+        @app.route("/a/<int:y>")
+        async def second(request, y):
+            pass
+
+        with self.assertRaises(ValueError):
+            app.freeze()
+
+        app = Freesia()
+        app.set_filter("word", (r"[^/]+", str, str))
+
+        @app.route("/b/<name>")
+        async def third(request, name):
+            pass
+
+        @app.route("/b/<word:name>")
+        async def fourth(request, name):
+            pass
+
+        with self.assertRaises(ValueError):
+            app.freeze()
+
+
+class CustomRoute(AbstractRoute):
+    is_static = True
+
+    def __init__(self, rule, methods, target, options):
+        self.rule = self.regex_pattern = rule
+        self.methods = set(methods)
+        self.target = target
+        self.endpoint = target.__name__
+
+    def set_filter(self, name, url_filter):
+        pass
+
+    def compile(self):
+        pass
+
+
+class CustomRouteTestCase(unittest.TestCase):
+    def test_custom_route(self):
+        app = Freesia()
+        app.route_cls = CustomRoute
+
+        @app.route("/custom")
+        async def custom(request):
+            return "custom"
+
+        self.assertIs(CustomRoute("/", ["GET"], custom, {}).handler, custom)
+        app.freeze()
+        res = asyncio.run(app.handler(make_mocked_request("GET", "/custom")))
+        self.assertEqual(res.text, "custom")
+
+
+class MiddlewareTestCase(unittest.TestCase):
+    def test_without_middleware(self):
+        app = Freesia()
+        self.assertEqual(app.middleware_chain, app.dispatch_request)
+
+    def test_middleware_order(self):
+        app = Freesia()
+
+        @app.route("/")
+        async def index(request):
+            return "hello"
+
+        async def m1(request, handler):
+            return await handler() + " !"
+
+        async def m2(request, handler):
+            return await handler() + " :D"
+
+        app.use([m1])
+        app.use([m2])
+        res = asyncio.run(app.handler(make_mocked_request("GET", "/")))
+        self.assertEqual(res.text, "hello ! :D")
+
+        async def user_handler():
+            return "user"
+
+        with self.assertWarns(DeprecationWarning):
+            res = asyncio.run(app.traverse_middleware(make_mocked_request("GET", "/"), user_handler))
+        self.assertEqual(res, "user ! :D")
+
+    def test_scoped_middleware(self):
+        app = Freesia()
+        calls = []
+
+        async def route_m(request, handler):
+            calls.append("route")
+            return await handler()
+
+        async def prefix_m(request, handler):
+            calls.append("prefix")
+            return await handler()
+
+        @app.route("/api/<name>", middleware=[route_m])
+        async def api(request, name):
+            return name
+
+        @app.route("/health")
+        async def health(request):
+            return "ok"
+
+        @app.route("/apis")
+        async def apis(request):
+            return "apis"
+
+        app.use([prefix_m], prefix="/api")
+        self.assertIs(app.url_map.get("/health", "GET")[0], health)
+        self.assertIs(app.url_map.get("/apis", "GET")[0], apis)
+
+        res = asyncio.run(app.handler(make_mocked_request("GET", "/api/mike")))
+        self.assertEqual(res.text, "mike")
+        self.assertEqual(calls, ["prefix", "route"])
+
+
+class CastTestCase(unittest.TestCase):
+    def cast(self, res, app=None):
+        return asyncio.run((app or Freesia()).cast(res))
+
+    def test_response(self):
+        res = Response(text="hello")
+        self.assertIs(self.cast(res), res)
+
+    def test_bytes(self):
+        for body in (b"hello", bytearray(b"hello"), memoryview(b"hello")):
+            with self.subTest(body=body):
+                res = self.cast(body)
+                self.assertIs(res._body if isinstance(body, (bytes, bytearray)) else res._body._value, body)
+
+    def test_tuple(self):
+        res = self.cast(("hello",))
+        self.assertEqual((res.text, res.status), ("hello", 200))
+        res = self.cast(("hello", 201, "Created"))
+        self.assertEqual((res.text, res.status, res.reason), ("hello", 201, "Created"))
+        res = self.cast((b"hello", 202, {"X-Test": "1"}))
+        self.assertEqual((res.body, res.status, res.headers["X-Test"]), (b"hello", 202, "1"))
+        res = self.cast(["hello", 201])
+        self.assertEqual((res.text, res.status), ("hello", 201))
+        with self.assertRaises(ValueError):
+            self.cast(("hello", 200, "ok", "other"))
+
+    def test_custom_cast(self):
+        app = Freesia()
+        app.add_response_cast(dict, lambda res: Response(text="dict"))
+        self.assertEqual(self.cast({}, app).text, "dict")
+        self.assertEqual(self.cast(1, app).text, "1")
+
+
+class ServeTestCase(unittest.TestCase):
+    def test_serve_handle(self):
+        app = Freesia()
+
+        @app.route("/")
+        async def index(request):
+            return "hello"
+
+        async def main():
+            handle = await app.serve("127.0.0.1", 0, banner=False, backlog=16, keepalive_timeout=5)
+            async with ClientSession() as session:
+                async with session.get("http://127.0.0.1:{}/".format(handle.port)) as res:
+                    text = await res.text()
+            await handle.stop()
+            await handle
+            return text
+
+        self.assertEqual(asyncio.run(main()), "hello")
+
+    def test_loop_policy(self):
+        with self.assertRaises(ValueError):
+            install_loop_policy("unknown")
+        install_loop_policy("auto")
+        asyncio.set_event_loop_policy(None)
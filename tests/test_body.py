@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+
+from aiohttp import ClientSession, FormData
+
+from freesia import Freesia
+from freesia.body import read_json, read_multipart
+
+
+class BodyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.uploads = []
+
+        @self.app.route("/json", method=["POST"], max_body_size=64)
+        async def json_body(request):
+            data = await read_json(request)
+            return str(data["count"])
+
+        @self.app.route("/upload", method=["POST"])
+        async def upload(request):
+            form = await read_multipart(request, memory_threshold=16)
+            f = form["file"]
+            self.uploads.append(f)
+            return "{} {} {} {}".format(form["name"], f.filename, f.in_memory, len(await f.read()))
+
+    def post(self, path, **kwargs):
+        async def main():
+            handle = await self.app.serve("127.0.0.1", 0, banner=False)
+            async with ClientSession() as session:
+                async with session.post("http://127.0.0.1:{}{}".format(handle.port, path), **kwargs) as res:
+                    result = res.status, await res.text()
+            await handle.stop()
+            return result
+
+        return asyncio.run(main())
+
+    def test_json(self):
+        self.assertEqual(self.post("/json", json={"count": 1}), (200, "1"))
+        self.assertEqual(self.post("/json", data=b"{")[0], 400)
+
+    def test_too_large(self):
+        self.assertEqual(self.post("/json", json={"count": "x" * 100})[0], 413)
+
+    def test_too_large_chunked(self):
+        async def chunks():
+            yield b'{"count": "'
+            yield b"x" * 100
+            yield b'"}'
+
+        self.assertEqual(self.post("/json", data=chunks())[0], 413)
+
+    def test_multipart(self):
+        for size, in_memory in ((8, True), (1024, False)):
+            form = FormData()
+            form.add_field("name", "mike")
+            form.add_field("file", b"x" * size, filename="a.txt", content_type="text/plain")
+            self.assertEqual(self.post("/upload", data=form), (200, "mike a.txt {} {}".format(in_memory, size)))
+        for f in self.uploads:
+            f.close()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia, Group
+from freesia.cache import CachedResponse, MemoryCacheBackend
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.calls = 0
+
+        @self.app.route("/users/<int:id>", cache=10, cache_headers=("Accept-Language",))
+        async def user(request, id):
+            self.calls += 1
+            return "user %d" % id
+
+    def handle(self, path, **headers):
+        return asyncio.run(self.app.handler(make_mocked_request("GET", path, headers=headers)))
+
+    def test_hit(self):
+        self.assertEqual(self.handle("/users/1").text, "user 1")
+        self.assertEqual(self.handle("/users/1").text, "user 1")
+        self.handle("/users/2")
+        self.handle("/users/1", **{"Accept-Language": "en"})
+        self.assertEqual(self.calls, 3)
+        self.assertEqual((self.app.response_cache.hits, self.app.response_cache.misses), (1, 3))
+
+    def test_invalidate(self):
+        self.handle("/users/1")
+        asyncio.run(self.app.response_cache.invalidate("user"))
+        self.handle("/users/1")
+        self.assertEqual(self.calls, 2)
+
+    def test_invalidate_path(self):
+        for path in ["/users/1", "/users/1?a=1", "/users/12", "/users/100"]:
+            self.handle(path)
+        asyncio.run(self.app.response_cache.invalidate("user", "/users/1"))
+        for path in ["/users/1", "/users/1?a=1", "/users/12", "/users/100"]:
+            self.handle(path)
+        self.assertEqual(self.calls, 6)
+
+    def test_group_route(self):
+        group = Group("api", "/api")
+
+        @group.route("/", cache=10)
+        async def index(request):
+            self.calls += 1
+            return "index"
+
+        self.app.register_group(group)
+        self.handle("/api/")
+        self.handle("/api/")
+        self.assertEqual(self.calls, 1)
+
+    def test_memory_backend(self):
+        backend = MemoryCacheBackend(max_bytes=10)
+        value = CachedResponse(200, "OK", (), b"hello")
+
+        async def main():
+            await backend.set("a", value, 10)
+            await backend.set("b", value, 10)
+            await backend.get("a")
+            await backend.set("c", value, 10)
+            res = [await backend.get(k) for k in "abc"]
+            await backend.set("d", value, -1)
+            res.append(await backend.get("d"))
+            return res
+
+        self.assertEqual(asyncio.run(main()), [value, None, value, None])
+        self.assertEqual(backend.evictions, 2)
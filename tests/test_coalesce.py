@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import HTTPNotFound
+
+from freesia import Freesia
+
+
+class CoalesceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.calls = 0
+
+        @self.app.route("/report/<int:id>", coalesce=True)
+        async def report(request, id):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            if id == 0:
+                raise HTTPNotFound()
+            if id < 0:
+                raise KeyError(id)
+            return "report %d" % id
+
+        @self.app.route("/submit/<int:id>", method=["POST"], coalesce=True)
+        async def submit(request, id):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return request.headers["X-Body"]
+
+        @self.app.route("/keyed/<int:id>", method=["POST"], coalesce=lambda request, id: id)
+        async def keyed(request, id):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return "keyed %d" % id
+
+    def gather(self, *paths):
+        async def main():
+            return await asyncio.gather(
+                *(self.app.handler(make_mocked_request("GET", p)) for p in paths), return_exceptions=True)
+
+        return asyncio.run(main())
+
+    def test_coalesce(self):
+        results = self.gather("/report/1", "/report/1", "/report/1", "/report/2")
+        self.assertEqual([r.text for r in results], ["report 1", "report 1", "report 1", "report 2"])
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.app.coalescer.coalesced, 2)
+        self.assertEqual(self.app.coalescer.flights, {})
+
+    def test_unsafe_methods(self):
+        async def main():
+            return await asyncio.gather(*(
+                self.app.handler(make_mocked_request("POST", path, headers={"X-Body": str(i)}))
+                for i, path in enumerate(["/submit/1"] * 3 + ["/keyed/1"] * 3)
+            ))
+
+        results = [r.text for r in asyncio.run(main())]
+        self.assertEqual(results[:3], ["0", "1", "2"])
+        self.assertEqual(results[3:], ["keyed 1"] * 3)
+        self.assertEqual(self.calls, 4)
+
+    def test_errors(self):
+        results = self.gather("/report/0", "/report/0", "/report/-1", "/report/-1")
+        self.assertEqual([r.status for r in results[:2]], [404, 404])
+        self.assertIsInstance(results[2], KeyError)
+        self.assertIs(results[2], results[3])
+        self.assertEqual(self.calls, 2)
+
+    def test_cancel(self):
+        async def main():
+            first = asyncio.ensure_future(self.app.handler(make_mocked_request("GET", "/report/1")))
+            second = asyncio.ensure_future(self.app.handler(make_mocked_request("GET", "/report/1")))
+            await asyncio.sleep(0)
+            first.cancel()
+            res = await second
+            with self.assertRaises(asyncio.CancelledError):
+                await first
+            return res
+
+        self.assertEqual(asyncio.run(main()).text, "report 1")
+        self.assertEqual(self.calls, 1)
+
+    def test_cancel_then_request(self):
+        async def main():
+            first = asyncio.ensure_future(self.app.handler(make_mocked_request("GET", "/report/1")))
+            await asyncio.sleep(0.005)
+            first.cancel()
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(self.app.handler(make_mocked_request("GET", "/report/1")))
+            await asyncio.sleep(0)
+            flights = list(self.app.coalescer.flights.values())
+            third = asyncio.ensure_future(self.app.handler(make_mocked_request("GET", "/report/1")))
+            await asyncio.sleep(0)
+            flights[0].task.cancel()
+            return await asyncio.gather(first, second, third, return_exceptions=True)
+
+        first, second, third = asyncio.run(main())
+        self.assertIsInstance(first, asyncio.CancelledError)
+        self.assertEqual((second.text, third.text), ("report 1", "report 1"))
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.app.coalescer.flights, {})
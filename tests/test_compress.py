@@ -0,0 +1,49 @@
+import asyncio
+import gzip
+import unittest
+
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia
+from freesia.compress import Compression, set_up_compression
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+
+        @self.app.route("/big")
+        async def big(request):
+            return "hello" * 1000
+
+        @self.app.route("/small")
+        async def small(request):
+            return "hello"
+
+        self.compression = set_up_compression(self.app, offload_size=2048)
+
+    def handle(self, path, accept_encoding="gzip, deflate"):
+        request = make_mocked_request("GET", path, headers={"Accept-Encoding": accept_encoding})
+        return asyncio.run(self.app.handler(request))
+
+    def test_negotiate(self):
+        c = Compression(self.app)
+        self.assertEqual(c.negotiate("deflate, gzip;q=0.5"), "deflate")
+        self.assertEqual(c.negotiate("gzip;q=0, deflate;q=0.1"), "deflate")
+        self.assertIsNone(c.negotiate("identity"))
+
+    def test_compress(self):
+        res = self.handle("/big")
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertEqual(res.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(res.body), b"hello" * 1000)
+
+    def test_min_size(self):
+        res = self.handle("/small")
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertEqual(res.body, b"hello")
+
+    def test_cache(self):
+        first = self.handle("/big").body
+        self.assertEqual(len(self.compression._cache), 1)
+        self.assertIs(self.handle("/big").body, first)
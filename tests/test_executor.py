@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import unittest
+import warnings
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia, MethodView
+from freesia.executor import ManagedExecutor, ExecutorBusy
+
+
+def fib(snapshot, n):
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return "{} {} {}".format(snapshot.method, snapshot.query.get("tag"), a)
+
+
+class ManagedExecutorTestCase(unittest.TestCase):
+    def test_stats(self):
+        executor = ManagedExecutor("test", max_workers=1, max_queue=1)
+        event = threading.Event()
+        first = executor.submit(event.wait)
+        second = executor.submit(event.wait)
+        self.assertRaises(ExecutorBusy, executor.submit, event.wait)
+        stats = executor.stats()
+        self.assertEqual((stats.queued, stats.active, stats.rejected, stats.utilisation), (1, 1, 1, 1.0))
+        event.set()
+        first.result()
+        second.result()
+        executor.shutdown()
+        stats = executor.stats()
+        self.assertEqual((stats.queued, stats.active, stats.completed, stats.utilisation), (0, 0, 2, 0))
+
+    def test_invalid_kind(self):
+        self.assertRaises(ValueError, ManagedExecutor, "test", "fiber")
+
+
+class OffloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.app.add_executor("cpu", kind="process", max_workers=1)
+        self.app.route("/fib/<int:n>", offload="cpu")(fib)
+
+    def test_offload(self):
+        async def main():
+            handle = await self.app.serve("127.0.0.1", 0, banner=False)
+            async with ClientSession() as session:
+                async with session.get("http://127.0.0.1:{}/fib/10?tag=x".format(handle.port)) as res:
+                    result = res.status, await res.text()
+            await handle.stop()
+            return result
+
+        self.assertEqual(asyncio.run(main()), (200, "GET x 55"))
+        stats = self.app.executor_stats()
+        self.assertEqual(stats["cpu"].completed, 1)
+        self.assertIn("default", stats)
+        self.app.executors["cpu"].shutdown()
+
+    def test_duplicated(self):
+        self.assertRaises(ValueError, self.app.add_executor, "cpu")
+
+        async def coroutine(request):
+            pass
+
+        self.assertRaises(ValueError, self.app.route("/coroutine", offload="cpu"), coroutine)
+        self.app.executors["cpu"].shutdown()
+
+
+class SyncHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+        @self.app.route("/sync/<name>", concurrency=2)
+        def sync(request, name):
+            with self.lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            time.sleep(0.02)
+            with self.lock:
+                self.running -= 1
+            return "{} {}".format(request.method, name)
+
+        class Items(MethodView):
+            async def get(self, request):
+                return "async"
+
+            def post(self, request):
+                return threading.current_thread().name
+
+        self.app.add_route("/items", view_func=Items.as_view(), options={"checking_param": False})
+
+        async def wrapped(request):
+            return "wrapped"
+
+        self.app.route("/wrapped")(lambda request: wrapped(request))
+
+    def request(self, method, path):
+        return asyncio.run(self.app.handler(make_mocked_request(method, path)))
+
+    def test_sync_handler(self):
+        async def main():
+            return await asyncio.gather(*[
+                self.app.handler(make_mocked_request("GET", "/sync/a")) for _ in range(6)
+            ])
+
+        completed = self.app.executor_stats()["default"].completed
+        self.assertEqual({r.text for r in asyncio.run(main())}, {"GET a"})
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(self.app.executor_stats()["default"].completed, completed)
+
+    def test_awaitable_result(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", RuntimeWarning)
+            self.assertEqual(self.request("GET", "/wrapped").text, "wrapped")
+
+    def test_sync_view_method(self):
+        self.assertEqual(self.request("GET", "/items").text, "async")
+        self.assertNotEqual(self.request("POST", "/items").text, threading.current_thread().name)
@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 
 from freesia import Group, Freesia
@@ -23,3 +24,22 @@ class GroupTestCase(unittest.TestCase):
 
         t, _ = app.url_map.get("/test/api", "GET")
         self.assertEqual(temp, t)
+
+    def test_group_middleware(self):
+        test = Group("test", "/test")
+
+        async def m(request, handler):
+            return await handler() + " :D"
+
+        @test.route("/api")
+        async def temp(request):
+            return "hello"
+
+        test.use([m])
+        app = Freesia()
+        app.register_group(test)
+
+        t, _ = app.url_map.get("/test/api", "GET")
+        self.assertNotEqual(temp, t)
+        self.assertEqual(asyncio.run(t(None)), "hello :D")
+        self.assertRaises(RuntimeError, test.use, [m])
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from aiohttp import ClientSession
+
+from freesia import Freesia
+from freesia.metrics import Metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_observe(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        series = metrics.endpoint_series("index")
+        metrics.observe(series, "GET", 200, 0.05)
+        metrics.observe(series, "GET", 200, 0.5)
+        metrics.observe(series, "GET", 200, 5)
+        metrics.observe(None, "GET", 404, 0.01)
+        self.assertEqual(series[("GET", 200)], [1, 1, 1, 5.55])
+        text = metrics.render()
+        self.assertIn('freesia_requests_total{endpoint="index",method="GET",status="200"} 3', text)
+        self.assertIn('freesia_request_duration_seconds_bucket{endpoint="index",method="GET",status="200",le="1.0"} 2',
+                      text)
+        self.assertIn('freesia_request_duration_seconds_count{endpoint="index",method="GET",status="200"} 3', text)
+        self.assertIn('freesia_requests_total{endpoint="",method="GET",status="404"} 1', text)
+
+    def test_invalid_buckets(self):
+        self.assertRaises(ValueError, Metrics, buckets=(1, 0.1))
+
+    def test_workers(self):
+        with tempfile.TemporaryDirectory() as d:
+            metrics = Metrics(buckets=(0.1,), directory=d)
+            metrics.add_gauge("queued", "Queued tasks.", lambda: {(("pool", "cpu"),): 2})
+            metrics.observe(metrics.endpoint_series("index"), "GET", 200, 0.05)
+            with open(os.path.join(d, "1.json"), "w") as f:
+                json.dump({"series": {"index": [["GET", 200, [2, 0, 0.1]]]},
+                           "gauges": {"queued": [[[["pool", "cpu"]], 1]]}}, f)
+            asyncio.run(metrics.stop())
+            self.assertTrue(os.path.exists(metrics.path))
+            text = metrics.render()
+        self.assertIn('freesia_requests_total{endpoint="index",method="GET",status="200"} 3', text)
+        self.assertIn('queued{{pool="cpu",pid="{}"}} 2'.format(os.getpid()), text)
+        self.assertIn('queued{pool="cpu",pid="1"} 1', text)
+
+
+class AppMetricsTestCase(unittest.TestCase):
+    def test_enable_metrics(self):
+        app = Freesia()
+
+        @app.route("/hello/<name>")
+        async def hello(request, name):
+            return "hello " + name
+
+        app.enable_metrics()
+        self.assertRaises(ValueError, app.enable_metrics)
+
+        async def main():
+            handle = await app.serve("127.0.0.1", 0, banner=False)
+            url = "http://127.0.0.1:{}".format(handle.port)
+            async with ClientSession() as session:
+                for path in ["/hello/a", "/hello/b", "/missing"]:
+                    async with session.get(url + path) as res:
+                        await res.read()
+                async with session.get(url + "/metrics") as res:
+                    text = await res.text()
+            await handle.stop()
+            return text
+
+        text = asyncio.run(main())
+        self.assertIn('freesia_requests_total{endpoint="hello",method="GET",status="200"} 2', text)
+        self.assertIn('freesia_requests_total{endpoint="",method="GET",status="404"} 1', text)
+        self.assertIn('freesia_executor_queued{executor="default"} 0', text)
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import unittest
+
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia, MethodView
+from freesia.monitor import LoopMonitor
+
+
+class LoopMonitorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+
+        @self.app.route("/block")
+        async def block(request):
+            time.sleep(0.3)
+            return "ok"
+
+        class Items(MethodView):
+            async def get(self, request):
+                time.sleep(0.3)
+                return "ok"
+
+        self.app.add_route("/items", view_func=Items.as_view(), options={"checking_param": False})
+        self.app.enable_metrics(path=None)
+        self.monitor = self.app.enable_loop_monitor(interval=0.01, threshold=0.1)
+
+    def run_requests(self, *paths):
+        async def main():
+            await self.app.startup()
+            await asyncio.sleep(0.05)
+            for path in paths:
+                await self.app.handler(make_mocked_request("GET", path))
+                await asyncio.sleep(0.05)
+            await self.app.shutdown()
+
+        asyncio.run(main())
+
+    def test_slow_callback(self):
+        self.run_requests("/block", "/items")
+        self.assertEqual(self.monitor.stalls, 2)
+        self.assertEqual([r.endpoint for r in self.monitor.slow_callbacks], ["block", "Items"])
+        self.assertIn("time.sleep(0.3)", self.monitor.slow_callbacks[0].stack)
+        self.assertGreater(self.monitor.max_lag, 0.1)
+        self.assertIn("freesia_loop_stalls 2", self.app.metrics.render())
+
+    def test_invalid_threshold(self):
+        self.assertRaises(ValueError, LoopMonitor, interval=1, threshold=0.5)
+        self.assertRaises(ValueError, self.app.enable_loop_monitor)
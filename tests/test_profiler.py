@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+
+from aiohttp import ClientSession
+from aiohttp.web import HTTPNotFound
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia
+from freesia.profiler import Profiler, ProfileRecord
+
+
+async def outer(request, handler):
+    await asyncio.sleep(0.02)
+    return await handler()
+
+
+async def inner(request, handler):
+    return await handler()
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+        self.app.use([inner, outer])
+
+        @self.app.route("/slow")
+        async def slow(request):
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        self.profiler = self.app.enable_profiler(path="/_profile", sample_rate=0)
+        self.handler = self.app.make_handler()
+
+    def request(self, path, headers=None):
+        return asyncio.run(self.handler(make_mocked_request("GET", path, headers=headers)))
+
+    def test_profile(self):
+        self.assertEqual(self.request("/slow").text, "ok")
+        self.assertEqual(self.profiler.stats, {})
+        self.assertEqual(self.request("/slow", {"X-Freesia-Profile": "1"}).text, "ok")
+        phases = self.profiler.dump()["slow"]
+        self.assertEqual(set(phases), {"total", "handler", "cast", "middleware:inner", "middleware:outer"})
+        self.assertGreaterEqual(phases["handler"]["total"], 0.05)
+        self.assertGreaterEqual(phases["middleware:outer"]["total"], 0.02)
+        self.assertLess(phases["middleware:inner"]["total"], 0.02)
+        self.assertGreaterEqual(phases["total"]["total"], 0.07)
+        self.profiler.reset()
+        self.assertEqual(self.profiler.dump(), {})
+
+    def test_not_found(self):
+        with self.assertRaises(HTTPNotFound):
+            self.request("/missing", {"X-Freesia-Profile": "1"})
+        self.assertEqual(self.profiler.dump()[""]["total"]["count"], 1)
+
+    def test_sampled(self):
+        self.assertTrue(Profiler(sample_rate=1).sampled(make_mocked_request("GET", "/")))
+        profiler = Profiler(trigger_value="secret")
+        self.assertFalse(profiler.sampled(make_mocked_request("GET", "/", headers={"X-Freesia-Profile": "1"})))
+        self.assertTrue(profiler.sampled(make_mocked_request("GET", "/", headers={"X-Freesia-Profile": "secret"})))
+        self.assertRaises(ValueError, Profiler, sample_rate=2)
+
+    def test_self_times(self):
+        record = ProfileRecord()
+        record.hops = [("handler", 1.0), ("middleware:a", 1.5), ("middleware:b", 3.0)]
+        self.assertEqual(record.self_times(), [("handler", 1.0), ("middleware:a", 0.5), ("middleware:b", 1.5)])
+
+    def test_dump_route(self):
+        async def main():
+            handle = await self.app.serve("127.0.0.1", 0, banner=False)
+            url = "http://127.0.0.1:{}".format(handle.port)
+            async with ClientSession() as session:
+                async with session.get(url + "/slow", headers={"X-Freesia-Profile": "1"}) as res:
+                    await res.read()
+                async with session.get(url + "/_profile") as res:
+                    data = await res.json()
+            await handle.stop()
+            return data
+
+        self.assertEqual(asyncio.run(main())["slow"]["handler"]["count"], 1)
@@ -1,7 +1,8 @@
+import asyncio
 import unittest
 from aiohttp.web import HTTPNotFound, HTTPMethodNotAllowed
 
-from freesia.route import Route, Router
+from freesia.route import Route, Router, TreeRouter, DispatchCache
 
 
 async def temp():
@@ -57,6 +58,20 @@ class RouterTestCase(unittest.TestCase):
         with self.assertRaises(HTTPMethodNotAllowed):
             router.get("/", "POST")
 
+    def test_dynamic_method_not_allowed(self):
+        router = Router()
+        router.add_route(Route("/a/<x>", ["GET"], temp, {"checking_param": False}))
+        router.add_route(Route("/b/<y>", ["POST"], temp, {"checking_param": False, "endpoint": "b"}))
+        router.freeze()
+        with self.assertRaises(HTTPMethodNotAllowed):
+            router.get("/a/1", "POST")
+        with self.assertRaises(HTTPMethodNotAllowed):
+            router.get("/a/1", "DELETE")
+        with self.assertRaises(HTTPNotFound):
+            router.get("/c/1", "POST")
+        handler, _ = router.get("/a/1", "OPTIONS")
+        self.assertEqual(asyncio.run(handler(None)).headers["Allow"], "GET,HEAD,OPTIONS")
+
     def test_build_url(self):
         r = Route("/test/<float:age>", ["GET"], temp, {
             "endpoint": "test",
@@ -67,3 +82,135 @@ class RouterTestCase(unittest.TestCase):
         self.assertEqual("/test/1.0", router.build_url("test", [1.0]))
         with self.assertRaises(ValueError):
             router.build_url("test", ["wrong"])
+
+
+class TreeRouterTestCase(unittest.TestCase):
+    def make_router(self, *rules):
+        router = TreeRouter()
+        for rule in rules:
+            router.add_route(Route(rule, ["GET"], temp, {
+                "endpoint": rule,
+                "checking_param": False
+            }))
+        return router
+
+    def test_get_from_tree(self):
+        router = self.make_router("/users/<int:id>/profile", "/users/<name>")
+        t, params = router.get("/users/42/profile", "GET")
+        self.assertEqual(t, temp)
+        self.assertEqual(params, [42])
+        _, params = router.get("/users/mike", "GET")
+        self.assertEqual(params, ["mike"])
+        with self.assertRaises(HTTPNotFound):
+            router.get("/users/42/other", "GET")
+
+    def test_filter_priority(self):
+        router = TreeRouter()
+        for rule, endpoint in (("/item/<name>", "name"), ("/item/<int:id>", "id"), ("/item/<name>.json", "json")):
+            async def target(request, param):
+                pass
+
+            target.__name__ = endpoint
+            router.add_route(Route(rule, ["GET"], target, {}))
+        self.assertEqual(router.get("/item/1", "GET")[0].__name__, "id")
+        self.assertEqual(router.get("/item/a.json", "GET")[0].__name__, "json")
+        self.assertEqual(router.get("/item/a", "GET")[0].__name__, "name")
+
+    def test_backtracking(self):
+        router = self.make_router("/<name>/a", "/<int:id>/b")
+        _, params = router.get("/1/a", "GET")
+        self.assertEqual(params, ["1"])
+
+    def test_span_segments(self):
+        router = self.make_router("/static/<path:name>")
+        _, params = router.get("/static/css/main.css", "GET")
+        self.assertEqual(params, ["css/main.css"])
+
+    def test_method_not_allowed(self):
+        router = self.make_router("/hello/<name>")
+        with self.assertRaises(HTTPMethodNotAllowed):
+            router.get("/hello/mike", "POST")
+
+
+class DispatchCacheTestCase(unittest.TestCase):
+    def make_cache(self, maxsize=2):
+        router = TreeRouter()
+        router.add_route(Route("/users/<int:id>", ["GET"], temp, {
+            "checking_param": False
+        }))
+        return DispatchCache(router, maxsize)
+
+    def test_hit_and_miss(self):
+        cache = self.make_cache()
+        self.assertEqual(cache.get("/users/1", "GET"), (temp, (1,)))
+        self.assertEqual(cache.get("/users/1", "GET"), (temp, (1,)))
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        cache = self.make_cache()
+        cache.get("/users/1", "GET")
+        cache.get("/users/2", "GET")
+        cache.get("/users/1", "GET")
+        cache.get("/users/3", "GET")
+        self.assertIn(("GET", "/users/1"), cache._cache)
+        self.assertNotIn(("GET", "/users/2"), cache._cache)
+
+    def test_negative_result(self):
+        cache = self.make_cache()
+        for _ in range(2):
+            with self.assertRaises(HTTPNotFound):
+                cache.get("/nothing", "GET")
+            with self.assertRaises(HTTPMethodNotAllowed):
+                cache.get("/users/1", "POST")
+        self.assertEqual(cache.cache_info().hits, 2)
+
+    def test_invalidate_on_add_route(self):
+        cache = self.make_cache()
+        with self.assertRaises(HTTPNotFound):
+            cache.get("/posts/1", "GET")
+        cache.add_route(Route("/posts/<int:id>", ["GET"], temp, {
+            "checking_param": False
+        }))
+        self.assertEqual(cache.get("/posts/1", "GET"), (temp, (1,)))
+
+
+class AllowIndexTestCase(unittest.TestCase):
+    def make_routers(self):
+        for router in (Router(), TreeRouter()):
+            router.add_route(Route("/", ["GET"], temp, {
+                "checking_param": False
+            }))
+            router.add_route(Route("/users/<int:id>", ["GET", "PUT"], temp, {
+                "checking_param": False
+            }))
+            router.add_route(Route("/users/<int:id>", ["DELETE"], temp, {
+                "checking_param": False
+            }))
+            yield router
+
+    def test_allow_header(self):
+        for router in self.make_routers():
+            with self.subTest(router=router):
+                with self.assertRaises(HTTPMethodNotAllowed) as cm:
+                    router.get("/users/1", "POST")
+                self.assertEqual(cm.exception.headers["Allow"], "DELETE,GET,HEAD,OPTIONS,PUT")
+                with self.assertRaises(HTTPMethodNotAllowed) as cm:
+                    router.get("/", "POST")
+                self.assertEqual(cm.exception.headers["Allow"], "GET,HEAD,OPTIONS")
+
+    def test_head_fallback(self):
+        for router in self.make_routers():
+            with self.subTest(router=router):
+                self.assertEqual(router.get("/users/1", "HEAD"), (temp, [1]))
+                self.assertEqual(router.get("/", "HEAD")[0], temp)
+
+    def test_options(self):
+        for router in self.make_routers():
+            with self.subTest(router=router):
+                handler, _ = router.get("/users/1", "OPTIONS")
+                res = asyncio.run(handler(None, 1))
+                self.assertEqual(res.status, 204)
+                self.assertEqual(res.headers["Allow"], "DELETE,GET,HEAD,OPTIONS,PUT")
+                with self.assertRaises(HTTPNotFound):
+                    router.get("/posts", "OPTIONS")
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from functools import partial
+from unittest import mock
+
+from aiohttp import ClientSession, CookieJar
+from aiohttp.test_utils import make_mocked_request
+
+from freesia import Freesia, Group, Response
+from freesia.session import Session, SignedCookieSession, ServerSideSession, MemoryStore, SQLiteStore, \
+    get_session, set_up_session
+
+
+class SignedCookieSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.interface = SignedCookieSession("secret", compress_threshold=64)
+
+    def request(self, cookie):
+        return make_mocked_request("GET", "/", headers={"Cookie": "FREESIA_SESSION={}".format(cookie)})
+
+    def round_trip(self, interface, data, loader=None):
+        res = Response()
+        session = Session()
+        session.update(data)
+        asyncio.run(interface.save_session(None, res, session))
+        cookie = res.cookies["FREESIA_SESSION"].value
+        return cookie, asyncio.run((loader or interface).load_session(self.request(cookie)))
+
+    def test_round_trip(self):
+        cookie, session = self.round_trip(self.interface, {"user": "bob"})
+        self.assertFalse(cookie.startswith("."))
+        self.assertEqual(dict(session), {"user": "bob"})
+
+    def test_compress(self):
+        cookie, session = self.round_trip(self.interface, {"data": "a" * 512})
+        self.assertTrue(cookie.startswith("."))
+        self.assertLess(len(cookie), 256)
+        self.assertEqual(session["data"], "a" * 512)
+
+    def test_tampered(self):
+        cookie, _ = self.round_trip(self.interface, {"user": "bob"})
+        payload, ts, sig = cookie.split(".")
+        forged = "{}.{}.{}".format(payload[:-1] + "A", ts, sig)
+        self.assertEqual(dict(asyncio.run(self.interface.load_session(self.request(forged)))), {})
+        self.assertEqual(dict(asyncio.run(self.interface.load_session(self.request("junk")))), {})
+
+    def test_key_rotation(self):
+        old = SignedCookieSession("old")
+        rotated = SignedCookieSession(["new", "old"])
+        _, session = self.round_trip(old, {"user": "bob"}, loader=rotated)
+        self.assertEqual(session["user"], "bob")
+        _, session = self.round_trip(rotated, {"user": "bob"}, loader=old)
+        self.assertEqual(dict(session), {})
+
+    def test_max_age(self):
+        interface = SignedCookieSession("secret", max_age=10, cache_size=0)
+        cookie = interface.encode({"user": "bob"})
+        self.assertIsNotNone(interface.decode(cookie))
+        payload, ts, _ = cookie.split(".")
+        value = "{}.{}".format(payload, int(time.time()) - 20)
+        expired = "{}.{}".format(value, interface.sign(value, interface.secret_keys[0]))
+        self.assertIsNone(interface.decode(expired))
+
+    def test_cache(self):
+        interface = SignedCookieSession("secret", cache_size=2)
+        cookie, first = self.round_trip(interface, {"items": [1, 2]})
+        interface.decode = None  # the cached session should not be decoded again
+        second = asyncio.run(interface.load_session(self.request(cookie)))
+        first["items"].append(3)
+        self.assertEqual(second["items"], [1, 2])
+        self.round_trip(interface, {"a": 1})
+        self.round_trip(interface, {"b": 1})
+        self.assertEqual(len(interface._cache), 2)
+        self.assertNotIn(cookie, interface._cache)
+
+    def test_factory(self):
+        interface = partial(SignedCookieSession, secret_key="secret")()
+        self.assertEqual(interface.secret_keys, [b"secret"])
+        self.assertRaises(ValueError, SignedCookieSession, [])
+
+
+class ServerSideSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Freesia()
+
+        @self.app.route("/incr")
+        async def incr(request):
+            session = await get_session(request)
+            session["count"] = session.get("count", 0) + 1
+            return Response(text=str(session["count"]))
+
+        @self.app.route("/clear")
+        async def clear(request):
+            session = await get_session(request)
+            session.clear()
+            return Response(text="ok")
+
+        @self.app.route("/lazy")
+        async def lazy(request):
+            return Response(text="ok")
+
+    def test_write_behind(self):
+        interface = ServerSideSession(flush_interval=60)
+        set_up_session(self.app, lambda: interface)
+
+        async def main():
+            handle = await self.app.serve("127.0.0.1", 0, banner=False)
+            url = "http://127.0.0.1:{}".format(handle.port)
+            results = []
+            async with ClientSession(cookie_jar=CookieJar(unsafe=True)) as session:
+                for path in ["/incr", "/incr", "/lazy", "/incr"]:
+                    async with session.get(url + path) as res:
+                        results.append(await res.text())
+                cookie = session.cookie_jar.filter_cookies(url)["FREESIA_SESSION"].value
+                stored_before_stop = await interface.store.get(cookie)
+                await handle.stop()
+                stored = await interface.store.get(cookie)
+            return results, stored_before_stop, stored
+
+        results, before, stored = asyncio.run(main())
+        self.assertEqual(results, ["1", "2", "ok", "3"])
+        self.assertIsNone(before)
+        self.assertEqual(json.loads(stored), {"count": 3})
+
+    def test_group(self):
+        group = Group("g", "/g")
+
+        @group.route("/incr")
+        async def incr(request):
+            session = await get_session(request)
+            session["count"] = 1
+            return Response(text="ok")
+
+        interface = ServerSideSession(flush_interval=60)
+        set_up_session(group, lambda: interface)
+        self.app.register_group(group)
+        self.assertRaises(RuntimeError, set_up_session, group, lambda: interface)
+
+        async def main():
+            await self.app.startup()
+            res = await self.app.handler(make_mocked_request("GET", "/g/incr"))
+            sid = res.cookies["FREESIA_SESSION"].value
+            await self.app.shutdown()
+            return await interface.store.get(sid)
+
+        self.assertEqual(json.loads(asyncio.run(main())), {"count": 1})
+
+    def test_lazy_load(self):
+        interface = ServerSideSession(MemoryStore(), flush_interval=0)
+        interface.store.get = None  # the store should not be touched without `get_session`
+        set_up_session(self.app, lambda: interface)
+        res = asyncio.run(self.app.handler(self.request("/lazy", "sid")))
+        self.assertEqual(res.text, "ok")
+
+    def test_clear(self):
+        interface = ServerSideSession(flush_interval=0)
+        asyncio.run(interface.store.set_many({"sid": '{"count": 1}'}))
+        set_up_session(self.app, lambda: interface)
+        res = asyncio.run(self.app.handler(self.request("/incr", "sid")))
+        self.assertEqual(res.text, "2")
+        self.assertNotIn("FREESIA_SESSION", res.cookies)
+        asyncio.run(self.app.handler(self.request("/clear", "sid")))
+        self.assertIsNone(asyncio.run(interface.store.get("sid")))
+
+    def request(self, path, sid):
+        return make_mocked_request("GET", path, headers={"Cookie": "FREESIA_SESSION={}".format(sid)})
+
+
+class StoreTestCase(unittest.TestCase):
+    def check_store(self, store):
+        async def main():
+            await store.set_many({"a": "1", "b": "2"})
+            first = await store.get("a"), await store.get("b"), await store.get("c")
+            await store.set_many({"a": None, "b": "3"})
+            return first, (await store.get("a"), await store.get("b"))
+
+        self.assertEqual(asyncio.run(main()), (("1", "2", None), (None, "3")))
+
+    def test_memory_store(self):
+        self.check_store(MemoryStore())
+        store = MemoryStore(max_entries=1)
+        asyncio.run(store.set_many({"a": "1", "b": "2"}))
+        self.assertIsNone(asyncio.run(store.get("a")))
+        store = MemoryStore(ttl=-1)
+        asyncio.run(store.set_many({"a": "1"}))
+        self.assertIsNone(asyncio.run(store.get("a")))
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = SQLiteStore(os.path.join(d, "session.db"))
+            self.check_store(store)
+            store.close()
+            store = SQLiteStore(os.path.join(d, "session.db"), ttl=-1)
+            asyncio.run(store.set_many({"c": "1"}))
+            self.assertIsNone(asyncio.run(store.get("c")))
+            self.assertEqual(asyncio.run(store.get("b")), "3")
+            store.close()
+
+    def test_sqlite_store_per_process(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = SQLiteStore(os.path.join(d, "session.db"))
+            self.assertIsNone(store._conn)
+            asyncio.run(store.set_many({"a": "1"}))
+            parent = store._conn
+            with mock.patch("freesia.session.os.getpid", return_value=-1):
+                self.assertEqual(asyncio.run(store.get("a")), "1")
+                self.assertIsNot(store._conn, parent)
+                store.close()
+            parent.close()
+
+    def test_memory_store_in_worker(self):
+        interface = ServerSideSession(flush_interval=0)
+        with mock.patch("freesia.session.os.getpid", return_value=-1):
+            with self.assertWarns(RuntimeWarning):
+                asyncio.run(interface.start())
+
+
+class SlowStore(MemoryStore):
+    def __init__(self, fail=0):
+        super().__init__()
+        self.fail = fail
+        self.writes = []
+
+    async def set_many(self, items):
+        await asyncio.sleep(0.01)
+        if self.fail:
+            self.fail -= 1
+            raise OSError("store is down")
+        self.writes.append(dict(items))
+        await super().set_many(items)
+
+
+class FlushTestCase(unittest.TestCase):
+    def save(self, interface, sid, data):
+        session = Session(data)
+        session.sid = sid
+        session._new = False
+        return interface.save_session(None, Response(), session)
+
+    def test_overlapping_flush(self):
+        interface = ServerSideSession(SlowStore(), flush_interval=0)
+
+        async def main():
+            first = asyncio.ensure_future(self.save(interface, "A", {"user": "a"}))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(self.save(interface, "B", {"user": "b"}))
+            await asyncio.sleep(0.015)
+            loaded = await interface.load_session(make_mocked_request(
+                "GET", "/", headers={"Cookie": "FREESIA_SESSION=A"}))
+            await asyncio.gather(first, second)
+            return loaded
+
+        loaded = asyncio.run(main())
+        self.assertEqual(dict(loaded), {"user": "a"})
+        self.assertFalse(loaded.new)
+        self.assertEqual(interface.store.writes, [{"A": '{"user": "a"}'}, {"B": '{"user": "b"}'}])
+
+    def test_failed_flush(self):
+        interface = ServerSideSession(SlowStore(fail=1), flush_interval=0.01)
+
+        async def main():
+            await self.save(interface, "A", {"user": "a"})
+            with self.assertLogs("freesia.session", "ERROR"):
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.05)
+            await interface.stop()
+
+        asyncio.run(main())
+        self.assertEqual(interface.store.writes, [{"A": '{"user": "a"}'}])
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from aiohttp import ClientSession
+
+from freesia import Freesia
+from freesia.static import parse_range, SendfileResponse
+
+
+class StaticTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.dir.name, "small.txt"), "wb") as f:
+            f.write(b"hello, world")
+        with open(os.path.join(self.dir.name, "big.bin"), "wb") as f:
+            f.write(bytes(range(256)) * 1024)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def fetch(self, requests, **options):
+        app = Freesia()
+        files = app.static("/static", self.dir.name, max_cached_file=1024, **options)
+
+        async def main():
+            handle = await app.serve("127.0.0.1", 0, banner=False)
+            results = []
+            async with ClientSession() as session:
+                for path, headers in requests:
+                    url = "http://127.0.0.1:{}{}".format(handle.port, path)
+                    async with session.get(url, headers=headers) as res:
+                        results.append((res.status, res.headers, await res.read()))
+            await handle.stop()
+            return results
+
+        return files, asyncio.run(main())
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 100))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+
+    def test_small_file(self):
+        files, results = self.fetch([("/static/small.txt", {}), ("/static/small.txt", {})])
+        status, headers, body = results[0]
+        self.assertEqual((status, body), (200, b"hello, world"))
+        self.assertEqual(headers["Content-Type"], "text/plain")
+        self.assertEqual(files.cached_bytes, 12)
+
+    def test_big_file(self):
+        files, results = self.fetch([("/static/big.bin", {}), ("/static/big.bin", {"Range": "bytes=256-511"})])
+        self.assertEqual(results[0][0], 200)
+        self.assertEqual(results[0][2], bytes(range(256)) * 1024)
+        self.assertEqual(results[1][0], 206)
+        self.assertEqual(results[1][2], bytes(range(256)))
+        self.assertEqual(results[1][1]["Content-Range"], "bytes 256-511/262144")
+        self.assertEqual(files.cached_bytes, 0)
+
+    def test_sendfile_fallback(self):
+        with mock.patch.object(asyncio.BaseEventLoop, "sendfile", side_effect=NotImplementedError), \
+                mock.patch.object(SendfileResponse, "chunk_size", 1000):
+            _, results = self.fetch([("/static/big.bin", {}), ("/static/big.bin", {"Range": "bytes=256-2511"})])
+        self.assertEqual(results[0][0], 200)
+        self.assertEqual(results[0][2], bytes(range(256)) * 1024)
+        self.assertEqual(results[1][0], 206)
+        self.assertEqual(results[1][2], (bytes(range(256)) * 10)[256:2512])
+
+    def test_conditional(self):
+        _, results = self.fetch([("/static/small.txt", {})])
+        etag = results[0][1]["ETag"]
+        _, results = self.fetch([("/static/small.txt", {"If-None-Match": etag}),
+                                 ("/static/small.txt", {"If-Modified-Since": results[0][1]["Last-Modified"]})])
+        self.assertEqual([r[0] for r in results], [304, 304])
+
+    def test_symlink(self):
+        with open(os.path.join(self.dir.name, "secret.txt"), "wb") as f:
+            f.write(b"secret")
+        public = os.path.join(self.dir.name, "pub")
+        os.mkdir(public)
+        os.symlink(os.path.join("..", "secret.txt"), os.path.join(public, "link.txt"))
+        os.symlink("link.txt", os.path.join(public, "inner.txt"))
+        with open(os.path.join(public, "a.txt"), "wb") as f:
+            f.write(b"a")
+        app = Freesia()
+        app.static("/s", public)
+        app.static("/f", public, endpoint="followed", follow_symlinks=True)
+
+        async def main():
+            handle = await app.serve("127.0.0.1", 0, banner=False)
+            results = []
+            async with ClientSession() as session:
+                for path in ["/s/link.txt", "/s/inner.txt", "/s/a.txt", "/f/link.txt"]:
+                    async with session.get("http://127.0.0.1:{}{}".format(handle.port, path)) as res:
+                        results.append((res.status, await res.read()))
+            await handle.stop()
+            return results
+
+        self.assertEqual([r[0] for r in asyncio.run(main())], [404, 404, 200, 200])
+
+    def test_not_found(self):
+        _, results = self.fetch([("/static/none.txt", {}), ("/static/../test_static.py", {}),
+                                 ("/static/small.txt", {"Range": "bytes=100-"})])
+        self.assertEqual([r[0] for r in results], [404, 404, 416])
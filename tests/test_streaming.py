@@ -0,0 +1,67 @@
+import asyncio
+import unittest
+
+from aiohttp import ClientSession
+
+from freesia import Freesia
+from freesia.streaming import StreamingResponse
+
+
+class StreamingTestCase(unittest.TestCase):
+    def fetch(self, app, path):
+        async def main():
+            handle = await app.serve("127.0.0.1", 0, banner=False)
+            async with ClientSession() as session:
+                async with session.get("http://127.0.0.1:{}{}".format(handle.port, path)) as res:
+                    result = res.status, res.headers, await res.read()
+            await handle.stop()
+            return result
+
+        return asyncio.run(main())
+
+    def test_async_generator(self):
+        app = Freesia()
+
+        @app.route("/")
+        async def index(request):
+            async def chunks():
+                for i in range(3):
+                    yield "chunk %d\n" % i
+
+            return chunks(), 201, {"X-Test": "1"}
+
+        status, headers, body = self.fetch(app, "/")
+        self.assertEqual((status, headers["X-Test"]), (201, "1"))
+        self.assertEqual(headers["Transfer-Encoding"], "chunked")
+        self.assertEqual(body, b"chunk 0\nchunk 1\nchunk 2\n")
+
+    def test_streaming_response(self):
+        app = Freesia()
+        closed = []
+
+        class Rows:
+            def __aiter__(self):
+                return self.rows()
+
+            async def rows(self):
+                try:
+                    yield b"a,b\n"
+                    yield b"1,2\n"
+                finally:
+                    closed.append(True)
+
+        @app.route("/")
+        async def index(request):
+            return StreamingResponse(Rows(), content_type="text/csv")
+
+        status, headers, body = self.fetch(app, "/")
+        self.assertEqual(headers["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(body, b"a,b\n1,2\n")
+        self.assertEqual(closed, [True])
+
+    def test_cast(self):
+        async def gen():
+            yield b""
+
+        res = asyncio.run(Freesia().cast(gen()))
+        self.assertIsInstance(res, StreamingResponse)
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from freesia import utils
+from freesia.utils import jsonify, jsonify_stream, iter_json_chunks, asy_json_dump, asy_json_load, \
+    estimate_json_size, set_json_backend
+
+
+class JSONTestCase(unittest.TestCase):
+    def tearDown(self):
+        set_json_backend("json")
+
+    def test_estimate_size(self):
+        self.assertLess(estimate_json_size({"count": 1}), 100)
+        self.assertGreaterEqual(estimate_json_size(list(range(100000)), 1024), 1024)
+        self.assertGreaterEqual(estimate_json_size({"a": "x" * 2048}, 1024), 1024)
+
+    def test_inline_and_offload(self):
+        with mock.patch.object(utils.block_pool_exc, "submit", wraps=utils.block_pool_exc.submit) as submit:
+            self.assertEqual(asyncio.run(asy_json_dump({"count": 1})), '{"count": 1}')
+            self.assertEqual(asyncio.run(asy_json_load('{"count": 1}')), {"count": 1})
+            self.assertEqual(submit.call_count, 0)
+            big = ["x" * 100] * 1000
+            self.assertEqual(asyncio.run(asy_json_load(asyncio.run(asy_json_dump(big)))), big)
+            self.assertEqual(submit.call_count, 2)
+
+    def test_custom_backend(self):
+        set_json_backend((lambda d: json.dumps(d, separators=(",", ":")).encode(), json.loads))
+        self.assertEqual(asyncio.run(asy_json_dump({"a": 1})), '{"a":1}')
+        res = asyncio.run(jsonify({"a": 1}))
+        self.assertEqual(res.body, b'{"a":1}')
+        self.assertEqual(res.headers["Content-Type"], "application/json; charset=utf-8")
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            set_json_backend("unknown")
+
+
+class JSONStreamTestCase(unittest.TestCase):
+    def collect(self, records, **options):
+        async def main():
+            return [c async for c in iter_json_chunks(records, **options)]
+
+        return asyncio.run(main())
+
+    def test_json_array(self):
+        records = [{"id": i} for i in range(100)]
+        chunks = self.collect(records, chunk_size=64, batch_size=7)
+        self.assertTrue(all(len(c) <= 64 for c in chunks))
+        self.assertEqual(json.loads(b"".join(chunks)), records)
+        self.assertEqual(self.collect([]), [b"[]"])
+
+    def test_ndjson_from_async_iterable(self):
+        async def records():
+            for i in range(10):
+                yield {"id": i}
+
+        body = b"".join(self.collect(records(), ndjson=True, batch_size=3))
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{"id": i} for i in range(10)])
+
+    def test_jsonify_stream(self):
+        res = jsonify_stream([], ndjson=True)
+        self.assertEqual(res.content_type, "application/x-ndjson")
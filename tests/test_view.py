@@ -1,6 +1,10 @@
+import asyncio
 import unittest
 
-from freesia import MethodView
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import HTTPMethodNotAllowed
+
+from freesia import Freesia, MethodView
 
 
 class ViewTestCase(unittest.TestCase):
@@ -13,3 +17,23 @@ class ViewTestCase(unittest.TestCase):
                 pass
 
         self.assertEqual(len(MyView.methods), 2)
+
+    def test_head(self):
+        class AsyncView(MethodView):
+            async def get(self, request):
+                return "async"
+
+        class SyncView(MethodView):
+            def get(self, request):
+                return "sync"
+
+        app = Freesia()
+        app.add_route("/a", view_func=AsyncView.as_view(), options={"checking_param": False})
+        app.add_route("/s", view_func=SyncView.as_view(), options={"checking_param": False})
+        for path, text in [("/a", "async"), ("/s", "sync")]:
+            res = asyncio.run(app.handler(make_mocked_request("HEAD", path)))
+            self.assertEqual(res.text, text)
+
+        with self.assertRaises(HTTPMethodNotAllowed) as cm:
+            asyncio.run(AsyncView().dispatch_request(make_mocked_request("POST", "/a")))
+        self.assertEqual(cm.exception.headers["Allow"], "GET")
@@ -0,0 +1,157 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import os
+import sys
+
+from freesia import Freesia
+
+app = Freesia()
+
+
+@app.route("/")
+async def index(request):
+    return str(os.getpid())
+
+
+app.run("127.0.0.1", int(sys.argv[1]), workers=2, restart_delay=0.2, max_failures=3)
+"""
+
+OFFLOAD_SCRIPT = """
+import os
+import sys
+
+from freesia import Freesia
+
+app = Freesia()
+app.add_executor("cpu", kind="process", max_workers=2)
+
+
+@app.route("/")
+async def index(request):
+    return str(os.getpid())
+
+
+def square(snapshot, n):
+    return "{} {} {}".format(os.getppid(), os.getpid(), n * n)
+
+
+app.route("/square/<int:n>", offload="cpu")(square)
+app.run("127.0.0.1", int(sys.argv[1]), workers=2, restart_delay=0.2, max_failures=3, banner=False,
+        reuse_port=True)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try:
+        # the orphaned zombies may not be reaped in the containers
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+@unittest.skipUnless(hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT"), "needs fork and SO_REUSEPORT")
+class SupervisorTestCase(unittest.TestCase):
+    def start(self, port, script=SCRIPT):
+        return subprocess.Popen([sys.executable, "-c", script, str(port)], cwd=ROOT,
+                                env=dict(os.environ, PYTHONPATH=ROOT),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def get_pid(self, port):
+        with urllib.request.urlopen("http://127.0.0.1:{}/".format(port), timeout=2) as res:
+            return int(res.read())
+
+    def collect_pids(self, port, count, timeout=10):
+        pids = set()
+        deadline = time.monotonic() + timeout
+        while len(pids) < count and time.monotonic() < deadline:
+            try:
+                pids.add(self.get_pid(port))
+            except OSError:
+                time.sleep(0.05)
+        return pids
+
+    def test_supervise(self):
+        port = free_port()
+        proc = self.start(port)
+        try:
+            pids = self.collect_pids(port, 2)
+            self.assertEqual(len(pids), 2)
+
+            victim = pids.pop()
+            os.kill(victim, signal.SIGKILL)
+            time.sleep(0.5)
+            new_pids = self.collect_pids(port, 2) - {victim}
+            self.assertEqual(len(new_pids), 2)
+            self.assertIn(pids.pop(), new_pids)
+
+            proc.send_signal(signal.SIGTERM)
+            self.assertEqual(proc.wait(timeout=10), 0)
+            for pid in new_pids:
+                self.assertRaises(ProcessLookupError, os.kill, pid, 0)
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+    def test_give_up(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            s.listen()
+            proc = self.start(s.getsockname()[1])
+            try:
+                self.assertNotEqual(proc.wait(timeout=20), 0)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+
+    def test_offload(self):
+        port = free_port()
+        proc = self.start(port, OFFLOAD_SCRIPT)
+
+        def get(n):
+            with urllib.request.urlopen("http://127.0.0.1:{}/square/{}".format(port, n), timeout=5) as res:
+                return tuple(map(int, res.read().split()))
+
+        try:
+            self.assertEqual(len(self.collect_pids(port, 2)), 2)
+            with ThreadPoolExecutor(16) as pool:
+                results = list(pool.map(get, range(40)))
+            self.assertEqual([r for _, _, r in results], [n * n for n in range(40)])
+            self.assertEqual(len({pid for pid, _, _ in results}), 2)
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        # the process pools are shut down with the workers
+        self.assertEqual(proc.returncode, 0)
+        pool_pids = {pid for _, pid, _ in results}
+        deadline = time.monotonic() + 5
+        while any(map(alive, pool_pids)) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(any(map(alive, pool_pids)))